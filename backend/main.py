@@ -1,75 +1,341 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel
 import google.generativeai as genai
+import PIL
 from PIL import Image
 import io
 import os
 from dotenv import load_dotenv
 import json
-import base64
+import orjson
+import re
 from typing import Optional
 import logging
 import traceback
 import asyncio
+import time
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-import hashlib
+from functools import lru_cache, partial
+from blake3 import blake3
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
+import aiofiles
+import aiofiles.os
 
-from utils.prompts import get_ta_prompt
+from utils.prompts import PROMPT_VERSIONS, get_ta_prompt
 from utils.image_annotator import annotate_chart
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+
+class AnalysisMetadata(BaseModel):
+    """Request parameters echoed back with an analysis"""
+    timeframe: str
+    asset_type: str
+    trade_direction: Optional[str] = None
+
+
+class AnalyzeResponse(BaseModel):
+    """Response body of /analyze"""
+    success: bool
+    analysis: dict
+    raw_response: str
+    original_image: str  # Absolute URL under /images (site-relative in the cache)
+    annotated_image: Optional[str] = None
+    metadata: AnalysisMetadata
+
 
 load_dotenv()
 
-app = FastAPI(title="Nano Banana TA Tool", version="1.0.0")
+# Configure logging - per-request detail is logged at DEBUG, so production
+# can run with LOG_LEVEL=WARNING and skip the formatting work entirely
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the cache size limit in the background for the app's lifetime"""
+    prune_task = asyncio.create_task(prune_cache_periodically()) if CACHE_MAX_BYTES > 0 else None
+    yield
+    if prune_task is not None:
+        prune_task.cancel()
+
+app = FastAPI(
+    title="Nano Banana TA Tool",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
+
+# Thread pool for CPU-bound PIL work (decode, resize, annotate, encode),
+# sized to the CPU count - more threads would only contend for cores.
+# Gemini calls use the SDK's async client and cache file I/O goes through
+# aiofiles, so neither competes with image work for these threads.
+cpu_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIL_WORKERS", os.cpu_count() or 4)),
+    thread_name_prefix="chart_pil"
+)
 
-# Thread pool executor for blocking I/O operations (Gemini API, PIL)
-# This allows FastAPI to handle many concurrent requests without blocking
-executor = ThreadPoolExecutor(max_workers=50, thread_name_prefix="chart_analyzer")
+# Pillow-SIMD (a drop-in Pillow fork with AVX2 resize/convert paths) publishes
+# ".postN" versions - log which build the PIL work is running on
+logger.info("Pillow %s (SIMD build: %s)", PIL.__version__, ".post" in PIL.__version__)
+
+# Uploads are read in chunks and rejected once they exceed the size limit
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Long edge (px) uploads are downscaled to before analysis
+MAX_IMAGE_EDGE = int(os.getenv("MAX_IMAGE_EDGE", "1568"))
 
 # Cache directory for storing analysis results
 # Use persistent disk path on Render, or local cache directory
 CACHE_DIR = Path(os.getenv("CACHE_DIR", "cache"))
 CACHE_DIR.mkdir(exist_ok=True, parents=True)
 
-def get_image_hash(image_bytes: bytes) -> str:
-    """Generate a hash of the image bytes for caching"""
-    return hashlib.sha256(image_bytes).hexdigest()
-
-def get_cache_path(image_hash: str, timeframe: str, asset_type: str, trade_direction: Optional[str] = None) -> Path:
-    """Get the cache file path for a given image hash and parameters"""
-    params = f"{timeframe}_{asset_type}"
-    if trade_direction:
-        params += f"_{trade_direction}"
-    return CACHE_DIR / f"{image_hash}_{params}.json"
-
-def load_from_cache(image_hash: str, timeframe: str, asset_type: str, trade_direction: Optional[str] = None) -> Optional[dict]:
-    """Load analysis result from cache if it exists"""
-    cache_path = get_cache_path(image_hash, timeframe, asset_type, trade_direction)
-    if cache_path.exists():
-        try:
-            with open(cache_path, 'r') as f:
-                cached_data = json.load(f)
-                logger.info(f"Cache hit for image hash: {image_hash[:16]}... (timeframe: {timeframe}, asset: {asset_type}, direction: {trade_direction})")
-                return cached_data
-        except Exception as e:
-            logger.warning(f"Failed to load cache: {e}")
+# Least recently used uploads (results and images) are deleted once the cache
+# grows past this size (0 disables the limit); the check runs every
+# CACHE_PRUNE_INTERVAL seconds. The default leaves headroom on a 1 GB disk.
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(768 * 1024 ** 2)))
+CACHE_PRUNE_INTERVAL = float(os.getenv("CACHE_PRUNE_INTERVAL", "600"))
+# Public origin the image URLs in responses are built on, e.g.
+# https://nano-banana-ta-backend.onrender.com. Unset, each request's own base
+# URL is used (uvicorn trusts X-Forwarded-Proto/Host from a local proxy)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+# Temp files older than this (seconds) were left behind by an interrupted write
+TMP_FILE_GRACE = 300
+# Version of the cached response body; 2 = site-relative image URLs
+CACHE_FORMAT = 2
+
+# In-process LRU in front of the disk cache, holding serialized responses
+# so cache hits skip both disk I/O and JSON encoding. Entries are re-read
+# from disk after MEM_CACHE_TTL seconds, which refreshes the disk entry's
+# recency for pruning and drops results whose files were pruned
+MEM_CACHE_SIZE = int(os.getenv("MEM_CACHE_SIZE", "128"))
+MEM_CACHE_TTL = 60
+_mem_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+# Analyses currently running, keyed like the cache, so concurrent identical
+# uploads await the first request's result instead of calling Gemini again
+_inflight: "dict[str, asyncio.Task]" = {}
+
+def _finish_flight(cache_key: str, task: asyncio.Task):
+    """Drop a finished analysis from _inflight and mark its exception retrieved"""
+    if _inflight.get(cache_key) is task:
+        del _inflight[cache_key]
+    if not task.cancelled():
+        task.exception()  # Requests awaiting it re-raise the exception themselves
+
+# Original and annotated images are written here once and served statically,
+# so responses carry short URLs instead of base64-encoded image data
+IMAGES_DIR = CACHE_DIR / "images"
+IMAGES_DIR.mkdir(exist_ok=True, parents=True)
+app.mount("/images", StaticFiles(directory=IMAGES_DIR), name="images")
+
+# Leading bytes of the accepted image formats, mapped to their file extension
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+def sniff_image_type(image_bytes: bytes) -> Optional[str]:
+    """Return the file extension for a supported image by its magic bytes, or None"""
+    for signature, ext in IMAGE_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return ext
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return ".webp"
     return None
 
-def save_to_cache(image_hash: str, timeframe: str, asset_type: str, trade_direction: Optional[str], result: dict):
-    """Save analysis result to cache"""
+def normalize_params(timeframe: Optional[str], asset_type: Optional[str], trade_direction: Optional[str]) -> tuple:
+    """Map the "use defaults" spellings of the form parameters ("auto", "", None) to None"""
+    return tuple(
+        None if value is None or value.strip().lower() in ("", "auto") else value.strip()
+        for value in (timeframe, asset_type, trade_direction)
+    )
+
+@lru_cache(maxsize=512)
+def get_prompt_fingerprint(prompt: str) -> str:
+    """
+    Short blake3 digest of a prompt's UTF-8 bytes. get_ta_prompt hands out
+    the same cached strings, so each prompt is encoded and hashed only once.
+    """
+    return blake3(prompt.encode("utf-8")).hexdigest()[:16]
+
+def get_cache_key(image_hash: str, prompt: str) -> str:
+    """
+    Build the cache key from the image and the exact prompt sent to Gemini.
+    Parameters that render the same prompt share an entry, and changes to the
+    prompt templates invalidate old results automatically.
+    """
+    prompt_hash = get_prompt_fingerprint(prompt)
+    # Analyses depend on the downscaled image, so a new size cap invalidates them.
+    # CACHE_FORMAT is bumped whenever the cached response body changes shape
+    return f"{image_hash}_{prompt_hash}_e{MAX_IMAGE_EDGE}_v{CACHE_FORMAT}"
+
+def get_cache_path(cache_key: str) -> Path:
+    """Get the cache file path for a given cache key"""
+    return CACHE_DIR / f"{cache_key}.json"
+
+async def _write_atomic(path: Path, payload: bytes):
+    """Write to a temp file and rename so readers never see a partial file"""
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    async with aiofiles.open(tmp_path, 'wb') as f:
+        await f.write(payload)
+    await aiofiles.os.replace(tmp_path, path)
+
+def image_url(name: str) -> str:
+    """
+    Site-relative URL of a stored image. Responses are cached and replayed to
+    other clients, so they must not carry the first requester's host or scheme;
+    with_image_urls makes them absolute per response.
+    """
+    return str(app.url_path_for("images", path=name))
+
+def with_image_urls(payload: bytes, request: Request) -> bytes:
+    """
+    Prefix the site-relative image paths in a serialized response with the
+    public base URL, so they resolve when the frontend is on another origin.
+    The fields are spliced as bytes instead of re-encoding the body. They are
+    serialized after analysis and raw_response, so the last match of each key
+    is the top-level field even if the model's JSON reuses the name.
+    """
+    base = (PUBLIC_BASE_URL or str(request.base_url).rstrip("/")).encode()
+    for key in (b'"original_image":"', b'"annotated_image":"'):
+        head, found, tail = payload.rpartition(key)
+        if found:
+            payload = head + key + base + tail
+    return payload
+
+async def save_image(name: str, image_data: bytes):
+    """Store a content-addressed image under IMAGES_DIR, skipping the write if it already exists"""
+    image_path = IMAGES_DIR / name
+    if not await aiofiles.os.path.exists(image_path):
+        await _write_atomic(image_path, image_data)
+
+def _mem_cache_get(key: str) -> Optional[bytes]:
+    """Look up a serialized result in the in-process LRU cache"""
+    entry = _mem_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, payload = entry
+    if time.monotonic() - stored_at > MEM_CACHE_TTL:
+        del _mem_cache[key]
+        return None
+    _mem_cache.move_to_end(key)
+    return payload
+
+def _mem_cache_put(key: str, payload: bytes):
+    """Store a serialized result in the in-process LRU cache, evicting the oldest entries"""
+    _mem_cache[key] = (time.monotonic(), payload)
+    _mem_cache.move_to_end(key)
+    while len(_mem_cache) > MEM_CACHE_SIZE:
+        _mem_cache.popitem(last=False)
+
+async def load_from_cache(cache_key: str) -> Optional[bytes]:
+    """Load serialized analysis result from memory, then disk, if it exists"""
+    payload = _mem_cache_get(cache_key)
+    if payload is not None:
+        logger.debug("Memory cache hit for key: %s", cache_key)
+        return payload
+    cache_path = get_cache_path(cache_key)
     try:
-        cache_path = get_cache_path(image_hash, timeframe, asset_type, trade_direction)
-        with open(cache_path, 'w') as f:
-            json.dump(result, f, indent=2)
-        logger.info(f"Cached result for image hash: {image_hash[:16]}... (timeframe: {timeframe}, asset: {asset_type}, direction: {trade_direction})")
+        async with aiofiles.open(cache_path, 'rb') as f:
+            payload = await f.read()
+    except FileNotFoundError:
+        return None
     except Exception as e:
-        logger.warning(f"Failed to save cache: {e}")
+        logger.warning("Failed to load cache: %s", e)
+        return None
+    # Mark the entry as recently used - pruning evicts by mtime, since
+    # atime isn't updated on most (relatime/noatime) mounts
+    try:
+        await asyncio.to_thread(os.utime, cache_path)
+    except OSError:
+        pass
+    _mem_cache_put(cache_key, payload)
+    logger.debug("Cache hit for key: %s", cache_key)
+    return payload
+
+async def save_to_cache(cache_key: str, payload: bytes):
+    """Save serialized analysis result to memory and disk cache"""
+    try:
+        _mem_cache_put(cache_key, payload)
+        await _write_atomic(get_cache_path(cache_key), payload)
+        logger.debug("Cached result for key: %s", cache_key)
+    except Exception as e:
+        logger.warning("Failed to save cache: %s", e)
+
+def _unlink(path: str):
+    """Delete a file, ignoring one another worker already removed"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def prune_cache(max_bytes: int) -> int:
+    """
+    Delete cached uploads, least recently used first, until CACHE_DIR fits in
+    max_bytes. An upload's result entries and images are removed together, so
+    no cached response is left pointing at a deleted image. Temp files left by
+    interrupted writes are removed once they are older than TMP_FILE_GRACE.
+    Returns how many uploads were evicted.
+    """
+    now = time.time()
+    uploads = {}  # image hash -> [newest mtime, total size, paths]
+    total = 0
+    for directory in (CACHE_DIR, IMAGES_DIR):
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith(".tmp"):
+                    if now - stat.st_mtime > TMP_FILE_GRACE:
+                        _unlink(entry.path)
+                    else:
+                        total += stat.st_size
+                    continue
+                # Results and images are all named after the upload's blake3 hex digest
+                upload = uploads.setdefault(entry.name[:64], [0.0, 0, []])
+                upload[0] = max(upload[0], stat.st_mtime)
+                upload[1] += stat.st_size
+                upload[2].append(entry.path)
+                total += stat.st_size
+    if total <= max_bytes:
+        return 0
+    
+    removed = 0
+    for _, size, paths in sorted(uploads.values()):
+        if total <= max_bytes:
+            break
+        for path in paths:
+            _unlink(path)
+        total -= size
+        removed += 1
+    return removed
+
+async def prune_cache_periodically():
+    """Keep the cache under CACHE_MAX_BYTES, scanning it in the PIL executor"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            removed = await loop.run_in_executor(cpu_executor, prune_cache, CACHE_MAX_BYTES)
+            if removed:
+                logger.info("Pruned %d cached uploads", removed)
+        except Exception as e:
+            logger.warning("Failed to prune cache: %s", e)
+        await asyncio.sleep(CACHE_PRUNE_INTERVAL)
+
+# Patterns for pulling the JSON analysis out of the model's response
+_JSON_DECODER = json.JSONDecoder()
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
 
 # CORS middleware for frontend
 # In production, replace "*" with your actual domain
@@ -102,6 +368,16 @@ genai.configure(api_key=api_key)
 model_name = os.getenv("GEMINI_MODEL", "nano-banana-pro-preview")
 model = genai.GenerativeModel(model_name)
 
+# Prompt body version: "1" is the full prompt, "2" the condensed one (fewer
+# input tokens). The version is part of the prompt hash, so caches don't mix.
+TA_PROMPT_VERSION = os.getenv("TA_PROMPT_VERSION", "1")
+if TA_PROMPT_VERSION not in PROMPT_VERSIONS:
+    raise ValueError(f"TA_PROMPT_VERSION must be one of {', '.join(PROMPT_VERSIONS)}")
+
+# /analyze is interactive - bound how long a single Gemini call may take so a
+# slow request fails fast instead of holding the client for minutes
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+
 
 @app.get("/")
 async def root():
@@ -128,7 +404,7 @@ async def health():
 @app.options("/analyze")
 async def analyze_options():
     """Handle CORS preflight requests"""
-    return JSONResponse(
+    return ORJSONResponse(
         content={},
         headers={
             "Access-Control-Allow-Origin": "*",
@@ -138,8 +414,9 @@ async def analyze_options():
     )
 
 
-@app.post("/analyze")
+@app.post("/analyze", response_model=AnalyzeResponse)
 async def analyze_chart(
+    request: Request,
     file: UploadFile = File(...),
     timeframe: str = Form(default="auto"),
     asset_type: str = Form(default="auto"),
@@ -147,11 +424,12 @@ async def analyze_chart(
 ):
     """
     Analyze a trading chart screenshot using Gemini vision model.
-    Returns technical analysis with entry/exit points and annotated image.
+    Returns technical analysis with entry/exit points and URLs of the original
+    and annotated images.
     
     This endpoint is designed to handle concurrent requests efficiently:
-    - Uses thread pool executor for blocking I/O operations
-    - Can handle up to 50+ concurrent requests
+    - Awaits the Gemini API via the SDK's async client
+    - Uses a CPU-sized thread pool only for blocking PIL operations
     - Each request runs independently without blocking others
     
     Args:
@@ -161,323 +439,379 @@ async def analyze_chart(
         trade_direction: Trade direction ('long', 'short', or None for both)
     """
     request_id = f"{file.filename}_{id(file)}"
-    logger.info(f"[{request_id}] Received upload request: {file.filename}, content_type: {file.content_type}, timeframe: {timeframe}, asset_type: {asset_type}, trade_direction: {trade_direction}")
+    logger.info(
+        "[%s] Received upload request: %s, content_type: %s, timeframe: %s, asset_type: %s, trade_direction: %s",
+        request_id, file.filename, file.content_type, timeframe, asset_type, trade_direction
+    )
     
     try:
-        # Read image bytes first
-        image_bytes = await file.read()
-        
-        # Generate image hash for caching
-        image_hash = get_image_hash(image_bytes)
-        logger.info(f"[{request_id}] Image hash: {image_hash[:16]}...")
-        
-        # Check cache first
-        cached_result = load_from_cache(image_hash, timeframe, asset_type, trade_direction)
-        if cached_result:
-            logger.info(f"[{request_id}] Returning cached result")
-            return JSONResponse(content=cached_result)
-        logger.info(f"[{request_id}] Image size: {len(image_bytes)} bytes")
+        # Stream the upload into a bounded buffer, hashing as chunks arrive
+        # so oversized files are rejected before they are fully buffered
+        hasher = blake3()
+        buffer = bytearray()
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            if len(buffer) + len(chunk) > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=413, detail="File too large. Max size: 10MB")
+            hasher.update(chunk)
+            buffer.extend(chunk)
+        image_bytes = bytes(buffer)
         
         if len(image_bytes) == 0:
             raise HTTPException(status_code=400, detail="Empty file uploaded")
         
-        # Validate file size (max 10MB)
-        max_size = 10 * 1024 * 1024  # 10MB
-        if len(image_bytes) > max_size:
-            raise HTTPException(status_code=400, detail=f"File too large ({len(image_bytes) / 1024 / 1024:.2f}MB). Max size: 10MB")
-        
-        # Process image in thread pool to avoid blocking event loop
-        def process_image(image_bytes_data, req_id):
-            """Process image synchronously - runs in thread pool"""
-            try:
-                img = Image.open(io.BytesIO(image_bytes_data))
-                logger.info(f"[{req_id}] Image opened successfully: {img.size}, mode: {img.mode}, format: {img.format}")
-                
-                # Verify it's actually an image by checking format
-                if img.format not in ['PNG', 'JPEG', 'JPG', 'GIF', 'WEBP']:
-                    logger.warning(f"[{req_id}] Unusual image format: {img.format}")
-                
-                # Convert to RGB if necessary (required for some image formats and Gemini API)
-                if img.mode == 'RGBA':
-                    # Convert RGBA to RGB with white background
-                    logger.info(f"[{req_id}] Converting RGBA to RGB with white background")
-                    rgb_image = Image.new('RGB', img.size, (255, 255, 255))
-                    if len(img.split()) == 4:
-                        rgb_image.paste(img, mask=img.split()[3])
-                    else:
-                        rgb_image.paste(img)
-                    img = rgb_image
-                elif img.mode != 'RGB':
-                    logger.info(f"[{req_id}] Converting image from {img.mode} to RGB")
-                    img = img.convert("RGB")
-                
-                return img
-            except Exception as e:
-                logger.error(f"[{req_id}] Failed to open image: {str(e)}")
-                raise ValueError(f"Invalid image file. Please upload a valid image (PNG, JPG, etc.). Error: {str(e)}")
-        
-        # Run image processing in thread pool
-        try:
-            image = await asyncio.get_event_loop().run_in_executor(
-                executor, process_image, image_bytes, request_id
-            )
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-        except Exception as e:
-            logger.error(f"[{request_id}] Failed to process image: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Invalid image file. Error: {str(e)}")
+        # Reject non-images by their magic bytes before any other work, so
+        # junk uploads never reach the cache or the in-flight table
+        original_ext = sniff_image_type(image_bytes)
+        if original_ext is None:
+            raise HTTPException(status_code=400, detail="Invalid image file. Please upload a PNG, JPG, GIF or WEBP image.")
         
-        # Validate file type by content (more reliable than MIME type)
-        if file.content_type:
-            valid_mime_types = ['image/png', 'image/jpeg', 'image/jpg', 'image/gif', 'image/webp']
-            if not any(mime in file.content_type.lower() for mime in ['image/png', 'image/jpeg', 'image/jpg', 'image/gif', 'image/webp']):
-                logger.warning(f"[{request_id}] Unusual content type: {file.content_type}, but image opened successfully")
+        image_hash = hasher.hexdigest()
+        logger.debug("[%s] Image hash: %.16s...", request_id, image_hash)
         
         # Get TA prompt with timeframe, asset type, and trade direction context
+        timeframe, asset_type, trade_direction = normalize_params(timeframe, asset_type, trade_direction)
         prompt = get_ta_prompt(
-            timeframe=timeframe if timeframe != "auto" else None,
-            asset_type=asset_type if asset_type != "auto" else None,
-            trade_direction=trade_direction
+            timeframe=timeframe,
+            asset_type=asset_type,
+            trade_direction=trade_direction,
+            version=TA_PROMPT_VERSION
         )
-        logger.info(f"[{request_id}] Sending request to Gemini API with timeframe: {timeframe}, asset_type: {asset_type}, trade_direction: {trade_direction}...")
+        cache_key = get_cache_key(image_hash, prompt)
         
-        # Call Gemini API in thread pool to avoid blocking event loop
-        def call_gemini_api(prompt_text, img, req_id):
-            """Call Gemini API synchronously - runs in thread pool"""
-            logger.info(f"[{req_id}] Calling Gemini API with model: {model_name}")
-            logger.info(f"[{req_id}] Prompt length: {len(prompt_text)} chars")
-            logger.info(f"[{req_id}] Image size: {img.size}, mode: {img.mode}")
-            
-            # Create a new model instance for this thread (thread-safe)
-            thread_model = genai.GenerativeModel(model_name)
-            
-            return thread_model.generate_content(
-                [
-                    prompt_text,
-                    img
-                ],
-                generation_config={
-                    "temperature": 0.0,  # Zero temperature for maximum accuracy and consistency
-                    "top_p": 0.95,
-                    "top_k": 40,
-                    "max_output_tokens": 4096,  # Increased for longer responses
-                },
-                safety_settings=[
-                    {
-                        "category": "HARM_CATEGORY_HARASSMENT",
-                        "threshold": "BLOCK_NONE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_HATE_SPEECH",
-                        "threshold": "BLOCK_NONE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        "threshold": "BLOCK_NONE",
-                    },
-                    {
-                        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                        "threshold": "BLOCK_NONE",
-                    },
-                ]
-            )
+        # Check cache first
+        cached_result = await load_from_cache(cache_key)
+        if cached_result:
+            logger.info("[%s] Returning cached result", request_id)
+            return Response(content=with_image_urls(cached_result, request), media_type="application/json")
         
-        # Run Gemini API call in thread pool
+        # Identical requests already being analyzed share a single Gemini call
+        # The analysis runs in its own task, so a cancelled request (client
+        # disconnect, shutdown) never cancels it for the requests sharing it
+        flight = _inflight.get(cache_key)
+        if flight is not None:
+            logger.info("[%s] Joining in-flight analysis", request_id)
+        else:
+            flight = asyncio.create_task(_run_analysis(
+                file, image_bytes, original_ext, image_hash, cache_key, prompt,
+                timeframe, asset_type, trade_direction, request_id
+            ))
+            _inflight[cache_key] = flight
+            flight.add_done_callback(partial(_finish_flight, cache_key))
+        payload = await asyncio.shield(flight)
+        
+        return Response(
+            content=with_image_urls(payload, request),
+            media_type="application/json",
+            headers={
+                "Access-Control-Allow-Origin": "*",
+                "Access-Control-Allow-Methods": "POST, OPTIONS",
+                "Access-Control-Allow-Headers": "*",
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Unexpected error: %s\n%s", e, traceback.format_exc())
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing image: {str(e)}"
+        )
+
+
+async def _run_analysis(
+    file: UploadFile,
+    image_bytes: bytes,
+    original_ext: str,
+    image_hash: str,
+    cache_key: str,
+    prompt: str,
+    timeframe: Optional[str],
+    asset_type: Optional[str],
+    trade_direction: Optional[str],
+    request_id: str
+) -> bytes:
+    """
+    Run the uncached analysis pipeline (decode, Gemini, annotate) for one upload.
+    Returns the serialized response body, which is also written to the cache.
+    """
+    logger.debug("[%s] Image size: %d bytes", request_id, len(image_bytes))
+    
+    # Process image in thread pool to avoid blocking event loop
+    def process_image(image_bytes_data, req_id):
+        """Process image synchronously - runs in thread pool"""
         try:
-            response = await asyncio.get_event_loop().run_in_executor(
-                executor, call_gemini_api, prompt, image, request_id
-            )
+            img = Image.open(io.BytesIO(image_bytes_data))
+            logger.debug("[%s] Image opened successfully: %s, mode: %s, format: %s", req_id, img.size, img.mode, img.format)
             
-            logger.info(f"Response received successfully")
+            # Convert to RGB if necessary (required for some image formats and Gemini API)
+            if img.mode == 'RGBA':
+                # Convert RGBA to RGB with white background
+                logger.debug("[%s] Converting RGBA to RGB with white background", req_id)
+                rgb_image = Image.new('RGB', img.size, (255, 255, 255))
+                if len(img.split()) == 4:
+                    rgb_image.paste(img, mask=img.split()[3])
+                else:
+                    rgb_image.paste(img)
+                img = rgb_image
+            elif img.mode != 'RGB':
+                logger.debug("[%s] Converting image from %s to RGB", req_id, img.mode)
+                img = img.convert("RGB")
             
-            # Handle multi-part responses properly
-            analysis_text = ""
-            logger.info(f"Response received: {type(response)}")
-            logger.info(f"Response attributes: {[attr for attr in dir(response) if not attr.startswith('_')]}")
+            # Downscale oversized charts - Gemini bills vision tokens by image size,
+            # and the long edge cap keeps all chart detail legible
+            width, height = img.size
+            scale = MAX_IMAGE_EDGE / max(width, height)
+            if scale < 1.0:
+                new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+                logger.debug("[%s] Downscaling image from %s to %s", req_id, img.size, new_size)
+                img = img.resize(new_size, Image.Resampling.LANCZOS)
             
-            try:
-                # Try the simple text accessor first (works for single-part responses)
-                analysis_text = response.text
-                logger.info(f"Got text from response.text: {len(analysis_text)} chars")
-            except ValueError as e:
-                # If that fails, extract text from parts (multi-part response)
-                logger.info(f"Multi-part response detected, extracting from parts: {str(e)}")
-                if response.candidates and len(response.candidates) > 0:
-                    logger.info(f"Found {len(response.candidates)} candidates")
-                    if hasattr(response.candidates[0], 'content') and hasattr(response.candidates[0].content, 'parts'):
-                        parts = response.candidates[0].content.parts
-                        logger.info(f"Found {len(parts)} parts in candidate content")
-                        text_parts = []
-                        for i, part in enumerate(parts):
-                            logger.info(f"Part {i}: type={type(part)}, has_text={hasattr(part, 'text')}")
-                            if hasattr(part, 'text') and part.text:
-                                text_parts.append(part.text)
-                                logger.info(f"Part {i} text length: {len(part.text)}")
-                        analysis_text = "\n".join(text_parts)
-                    else:
-                        # Try direct parts access
-                        parts = response.parts if hasattr(response, 'parts') else []
-                        logger.info(f"Trying direct parts access: {len(parts)} parts")
-                        text_parts = []
-                        for part in parts:
-                            if hasattr(part, 'text') and part.text:
-                                text_parts.append(part.text)
-                        analysis_text = "\n".join(text_parts)
-                elif hasattr(response, 'parts'):
+            return img
+        except Exception as e:
+            logger.error("[%s] Failed to open image: %s", req_id, e)
+            raise ValueError(f"Invalid image file. Please upload a valid image (PNG, JPG, etc.). Error: {str(e)}")
+    
+    # Run image processing in thread pool
+    try:
+        image = await asyncio.get_event_loop().run_in_executor(
+            cpu_executor, process_image, image_bytes, request_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error("[%s] Failed to process image: %s", request_id, e)
+        raise HTTPException(status_code=400, detail=f"Invalid image file. Error: {str(e)}")
+    
+    # Validate file type by content (more reliable than MIME type)
+    if file.content_type:
+        valid_mime_types = ['image/png', 'image/jpeg', 'image/jpg', 'image/gif', 'image/webp']
+        if not any(mime in file.content_type.lower() for mime in ['image/png', 'image/jpeg', 'image/jpg', 'image/gif', 'image/webp']):
+            logger.warning("[%s] Unusual content type: %s, but image opened successfully", request_id, file.content_type)
+    
+    logger.info("[%s] Calling Gemini API with model: %s", request_id, model_name)
+    logger.debug(
+        "[%s] Prompt length: %d chars, image size: %s, mode: %s",
+        request_id, len(prompt), image.size, image.mode
+    )
+    
+    # Call Gemini API asynchronously - awaited directly on the event loop,
+    # so concurrency is bound by the network rather than executor slots.
+    # The prompt opens with its static instructions (see _build_ta_prompt),
+    # so every request shares a long token prefix for Gemini's implicit cache.
+    try:
+        response = await model.generate_content_async(
+            [
+                prompt,
+                image
+            ],
+            generation_config={
+                "temperature": 0.0,  # Zero temperature for maximum accuracy and consistency
+                "top_p": 0.95,
+                "top_k": 40,
+                "max_output_tokens": 4096,  # Increased for longer responses
+            },
+            safety_settings=[
+                {
+                    "category": "HARM_CATEGORY_HARASSMENT",
+                    "threshold": "BLOCK_NONE",
+                },
+                {
+                    "category": "HARM_CATEGORY_HATE_SPEECH",
+                    "threshold": "BLOCK_NONE",
+                },
+                {
+                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                    "threshold": "BLOCK_NONE",
+                },
+                {
+                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+                    "threshold": "BLOCK_NONE",
+                },
+            ],
+            request_options={"timeout": GEMINI_TIMEOUT}
+        )
+        
+        # Handle multi-part responses properly
+        analysis_text = ""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response received: %s", type(response))
+            logger.debug("Response attributes: %s", [attr for attr in dir(response) if not attr.startswith('_')])
+        
+        try:
+            # Try the simple text accessor first (works for single-part responses)
+            analysis_text = response.text
+            logger.debug("Got text from response.text: %d chars", len(analysis_text))
+        except ValueError as e:
+            # If that fails, extract text from parts (multi-part response)
+            logger.debug("Multi-part response detected, extracting from parts: %s", e)
+            if response.candidates and len(response.candidates) > 0:
+                logger.debug("Found %d candidates", len(response.candidates))
+                if hasattr(response.candidates[0], 'content') and hasattr(response.candidates[0].content, 'parts'):
+                    parts = response.candidates[0].content.parts
+                    logger.debug("Found %d parts in candidate content", len(parts))
                     text_parts = []
-                    for part in response.parts:
+                    for i, part in enumerate(parts):
+                        logger.debug("Part %d: type=%s, has_text=%s", i, type(part), hasattr(part, 'text'))
                         if hasattr(part, 'text') and part.text:
                             text_parts.append(part.text)
+                            logger.debug("Part %d text length: %d", i, len(part.text))
                     analysis_text = "\n".join(text_parts)
                 else:
-                    logger.error("Could not extract text from response structure")
-                    logger.error(f"Response type: {type(response)}, attributes: {dir(response)}")
-                    # Try to get any text from response
-                    if hasattr(response, '__str__'):
-                        logger.error(f"Response string representation: {str(response)[:500]}")
-                    raise HTTPException(status_code=500, detail="Could not extract text from AI response. Response structure not recognized.")
-            except Exception as e:
-                logger.error(f"Unexpected error extracting text: {str(e)}\n{traceback.format_exc()}")
-                raise HTTPException(status_code=500, detail=f"Error extracting text from AI response: {str(e)}")
-            
-            if not analysis_text or len(analysis_text.strip()) == 0:
-                logger.error("Empty response from Gemini API")
-                logger.error(f"Response object: {response}")
-                logger.error(f"Response candidates: {getattr(response, 'candidates', 'N/A')}")
-                logger.error(f"Response finish_reason: {getattr(response, 'finish_reason', 'N/A')}")
-                logger.error(f"Response prompt_feedback: {getattr(response, 'prompt_feedback', 'N/A')}")
-                
-                # Check if there's a safety block
-                if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
-                    if hasattr(response.prompt_feedback, 'block_reason'):
-                        block_reason = response.prompt_feedback.block_reason
-                        logger.error(f"Response blocked: {block_reason}")
-                        raise HTTPException(
-                            status_code=500, 
-                            detail=f"AI response was blocked. Reason: {block_reason}. Try a different chart image."
-                        )
-                
-                raise HTTPException(
-                    status_code=500, 
-                    detail="Empty response from AI model. The model may have been blocked or encountered an error. Try uploading a different chart image."
-                )
-            
-            logger.info(f"Received analysis (length: {len(analysis_text)} chars)")
+                    # Try direct parts access
+                    parts = response.parts if hasattr(response, 'parts') else []
+                    logger.debug("Trying direct parts access: %d parts", len(parts))
+                    text_parts = []
+                    for part in parts:
+                        if hasattr(part, 'text') and part.text:
+                            text_parts.append(part.text)
+                    analysis_text = "\n".join(text_parts)
+            elif hasattr(response, 'parts'):
+                text_parts = []
+                for part in response.parts:
+                    if hasattr(part, 'text') and part.text:
+                        text_parts.append(part.text)
+                analysis_text = "\n".join(text_parts)
+            else:
+                logger.error("Could not extract text from response structure")
+                # Dumping the full response object is expensive - only do it when debugging
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Response type: %s, attributes: %s", type(response), dir(response))
+                    logger.debug("Response string representation: %.500s", response)
+                raise HTTPException(status_code=500, detail="Could not extract text from AI response. Response structure not recognized.")
+        except Exception as e:
+            logger.error("Unexpected error extracting text: %s\n%s", e, traceback.format_exc())
+            raise HTTPException(status_code=500, detail=f"Error extracting text from AI response: {str(e)}")
+        
+        if not analysis_text or len(analysis_text.strip()) == 0:
+            logger.error("Empty response from Gemini API")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Response object: %s", response)
+            logger.error("Response candidates: %s", getattr(response, 'candidates', 'N/A'))
+            logger.error("Response finish_reason: %s", getattr(response, 'finish_reason', 'N/A'))
+            logger.error("Response prompt_feedback: %s", getattr(response, 'prompt_feedback', 'N/A'))
             
-            # Try to extract JSON from response
-            json_data = extract_json_from_response(analysis_text)
+            # Check if there's a safety block
+            if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
+                if hasattr(response.prompt_feedback, 'block_reason'):
+                    block_reason = response.prompt_feedback.block_reason
+                    logger.error("Response blocked: %s", block_reason)
+                    raise HTTPException(
+                        status_code=500, 
+                        detail=f"AI response was blocked. Reason: {block_reason}. Try a different chart image."
+                    )
             
-            # Create annotated version of the chart (run in thread pool)
-            def create_annotated_chart(img, analysis_data, req_id):
-                """Create annotated chart synchronously - runs in thread pool"""
-                try:
-                    logger.info(f"[{req_id}] Creating annotated chart image...")
-                    logger.info(f"[{req_id}] JSON data type: {type(analysis_data)}")
-                    logger.info(f"[{req_id}] JSON data keys: {list(analysis_data.keys()) if isinstance(analysis_data, dict) else 'Not a dict'}")
+            raise HTTPException(
+                status_code=500, 
+                detail="Empty response from AI model. The model may have been blocked or encountered an error. Try uploading a different chart image."
+            )
+        
+        logger.debug("Received analysis (length: %d chars)", len(analysis_text))
+        
+        # Try to extract JSON from response
+        json_data = extract_json_from_response(analysis_text)
+        
+        # Create annotated version of the chart (run in thread pool)
+        def create_annotated_chart(img, analysis_data, req_id):
+            """Create annotated chart synchronously - runs in thread pool"""
+            try:
+                logger.debug("[%s] Creating annotated chart image...", req_id)
+                
+                # Always try to annotate - even if parsing failed, we can still try
+                if isinstance(analysis_data, dict):
+                    # Check if we have price data to annotate
+                    has_price_data = (
+                        analysis_data.get('entry') or 
+                        analysis_data.get('stop_loss') or 
+                        analysis_data.get('take_profits') or
+                        analysis_data.get('support_levels') or
+                        analysis_data.get('resistance_levels') or
+                        analysis_data.get('current_price')
+                    )
                     
-                    # Always try to annotate - even if parsing failed, we can still try
-                    if isinstance(analysis_data, dict):
-                        # Check if we have price data to annotate
-                        has_price_data = (
-                            analysis_data.get('entry') or 
-                            analysis_data.get('stop_loss') or 
-                            analysis_data.get('take_profits') or
-                            analysis_data.get('support_levels') or
-                            analysis_data.get('resistance_levels') or
-                            analysis_data.get('current_price')
-                        )
+                    if has_price_data or analysis_data.get('parsed') != False:
+                        logger.debug("[%s] Attempting to create annotations...", req_id)
+                        # img isn't used after this, so annotate it in place
+                        annotated = annotate_chart(img, analysis_data, copy=False)
                         
-                        if has_price_data or analysis_data.get('parsed') != False:
-                            logger.info(f"[{req_id}] Attempting to create annotations...")
-                            annotated = annotate_chart(img.copy(), analysis_data)
-                            
-                            # Verify annotation worked
-                            if annotated and annotated.size == img.size:
-                                # Convert annotated image to base64
-                                buffer = io.BytesIO()
-                                annotated.save(buffer, format="PNG")
-                                annotated_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                                logger.info(f"[{req_id}] ✅ Annotated chart created successfully! Base64 size: {len(annotated_base64)} bytes")
-                                return annotated_base64
-                            else:
-                                logger.warning(f"[{req_id}] ⚠️ Annotation returned invalid image. Original size: {img.size}, Annotated size: {annotated.size if annotated else 'None'}")
-                                return None
+                        # Verify annotation worked
+                        if annotated and annotated.size == img.size:
+                            # Encode annotated image (fast PNG compression - latency matters more than size)
+                            buffer = io.BytesIO()
+                            annotated.save(buffer, format="PNG", optimize=False, compress_level=1)
+                            annotated_png = buffer.getbuffer()  # Zero-copy view of the encoded PNG
+                            logger.debug("[%s] ✅ Annotated chart created successfully! PNG size: %d bytes", req_id, len(annotated_png))
+                            return annotated_png
                         else:
-                            logger.warning(f"[{req_id}] ⚠️ No price data found in analysis")
+                            logger.warning(
+                                "[%s] ⚠️ Annotation returned invalid image. Original size: %s, Annotated size: %s",
+                                req_id, img.size, annotated.size if annotated else None
+                            )
                             return None
                     else:
-                        logger.warning(f"[{req_id}] ⚠️ JSON data is not a dict, cannot annotate")
+                        logger.warning("[%s] ⚠️ No price data found in analysis", req_id)
                         return None
-                except Exception as annotate_error:
-                    logger.error(f"[{req_id}] ❌ Error during annotation: {str(annotate_error)}\n{traceback.format_exc()}")
+                else:
+                    logger.warning("[%s] ⚠️ JSON data is not a dict, cannot annotate", req_id)
                     return None
-            
-            annotated_base64 = None
-            try:
-                annotated_base64 = await asyncio.get_event_loop().run_in_executor(
-                    executor, create_annotated_chart, image, json_data, request_id
-                )
-            except Exception as e:
-                logger.error(f"[{request_id}] Failed to create annotated chart: {str(e)}\n{traceback.format_exc()}")
-                annotated_base64 = None
-            
-            # Convert original image to base64 for response (run in thread pool)
-            def convert_image_to_base64(img, req_id):
-                """Convert image to base64 synchronously - runs in thread pool"""
-                buffer = io.BytesIO()
-                img.save(buffer, format="PNG")
-                result = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                logger.info(f"[{req_id}] Image converted to base64: {len(result)} chars")
-                return result
-            
-            img_base64 = await asyncio.get_event_loop().run_in_executor(
-                executor, convert_image_to_base64, image, request_id
-            )
-            
-            logger.info(f"[{request_id}] Analysis complete, returning results")
-            
-            response_data = {
-                "success": True,
-                "analysis": json_data,
-                "raw_response": analysis_text,
-                "original_image": f"data:image/png;base64,{img_base64}",
-                "annotated_image": f"data:image/png;base64,{annotated_base64}" if annotated_base64 else None,
-                "metadata": {
-                    "timeframe": timeframe,
-                    "asset_type": asset_type,
-                    "trade_direction": trade_direction
-                }
-            }
-            
-            # Save to cache for future requests
-            save_to_cache(image_hash, timeframe, asset_type, trade_direction, response_data)
-            
-            logger.info("Analysis complete, returning results")
-            return JSONResponse(
-                content=response_data,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "POST, OPTIONS",
-                    "Access-Control-Allow-Headers": "*",
-                }
+            except Exception as annotate_error:
+                logger.error("[%s] ❌ Error during annotation: %s\n%s", req_id, annotate_error, traceback.format_exc())
+                return None
+        
+        # Annotation (thread pool) and storing the original upload (file I/O) are
+        # independent, so run them concurrently. The original is stored as-is -
+        # no need to re-encode it through PIL
+        original_name = f"{image_hash}{original_ext}"
+        annotated_png, save_result = await asyncio.gather(
+            asyncio.get_running_loop().run_in_executor(
+                cpu_executor, create_annotated_chart, image, json_data, request_id
+            ),
+            save_image(original_name, image_bytes),
+            return_exceptions=True
+        )
+        if isinstance(annotated_png, BaseException):
+            logger.error(
+                "[%s] Failed to create annotated chart: %s\n%s", request_id, annotated_png,
+                "".join(traceback.format_exception(annotated_png))
             )
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Gemini API error: {str(e)}\n{traceback.format_exc()}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"AI analysis error: {str(e)}"
+            annotated_png = None
+        if isinstance(save_result, BaseException):
+            raise save_result
+        
+        annotated_url = None
+        if annotated_png:
+            annotated_name = f"{cache_key}_annot.png"
+            await _write_atomic(IMAGES_DIR / annotated_name, annotated_png)
+            annotated_url = image_url(annotated_name)
+        
+        response_data = AnalyzeResponse(
+            success=True,
+            analysis=json_data,
+            raw_response=analysis_text,
+            original_image=image_url(original_name),
+            annotated_image=annotated_url,
+            metadata=AnalysisMetadata(
+                timeframe=timeframe or "auto",
+                asset_type=asset_type or "auto",
+                trade_direction=trade_direction
             )
-            
+        )
+        
+        payload = response_data.model_dump_json().encode("utf-8")
+        
+        # Save to cache for future requests
+        await save_to_cache(cache_key, payload)
+        
+        logger.info("[%s] Analysis complete, returning results", request_id)
+        return payload
+        
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}\n{traceback.format_exc()}")
+        logger.error("Gemini API error: %s\n%s", e, traceback.format_exc())
         raise HTTPException(
             status_code=500,
-            detail=f"Error processing image: {str(e)}"
+            detail=f"AI analysis error: {str(e)}"
         )
 
 
@@ -486,22 +820,30 @@ def extract_json_from_response(text: str) -> dict:
     Extract JSON from Gemini response text.
     Handles cases where JSON is wrapped in markdown code blocks.
     """
-    import re
+    # Fast path: decode the first JSON object in place, ignoring any trailing text
+    start = text.find('{')
+    if start != -1:
+        try:
+            parsed, _ = _JSON_DECODER.raw_decode(text, start)
+            if isinstance(parsed, dict):
+                return parsed
+        except ValueError:
+            pass
     
     # Try to find JSON in code blocks
-    json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
+    json_match = _JSON_FENCE_RE.search(text)
     if json_match:
         try:
-            return json.loads(json_match.group(1))
-        except json.JSONDecodeError:
+            return orjson.loads(json_match.group(1))
+        except orjson.JSONDecodeError:
             pass
     
     # Try to find JSON object directly
-    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    json_match = _JSON_OBJECT_RE.search(text)
     if json_match:
         try:
-            return json.loads(json_match.group(0))
-        except json.JSONDecodeError:
+            return orjson.loads(json_match.group(0))
+        except orjson.JSONDecodeError:
             pass
     
     # Fallback: return structured text response
@@ -512,6 +854,13 @@ def extract_json_from_response(text: str) -> dict:
 
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop is not available on Windows
+        http="httptools",
+    )
 
@@ -6,6 +6,7 @@ Or use uvicorn directly: uvicorn main:app --host 0.0.0.0 --port 8000 --workers 4
 
 import uvicorn
 import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,6 +18,10 @@ if __name__ == "__main__":
     workers = int(os.getenv("WORKERS", 4))  # Number of worker processes
     limit_concurrency = int(os.getenv("LIMIT_CONCURRENCY", 50))  # Max concurrent requests per worker
     
+    # uvloop (libuv event loop) and httptools (C HTTP parser) ship with
+    # uvicorn[standard]; uvloop is not available on Windows
+    loop = "asyncio" if sys.platform == "win32" else "uvloop"
+    
     print(f"Starting server with {workers} workers, max {limit_concurrency} concurrent requests per worker")
     print(f"Total capacity: ~{workers * limit_concurrency} concurrent requests")
     
@@ -25,6 +30,8 @@ if __name__ == "__main__":
         host=host,
         port=port,
         workers=workers,  # Multiple worker processes for better CPU utilization
+        loop=loop,
+        http="httptools",
         limit_concurrency=limit_concurrency,  # Max concurrent connections per worker
         backlog=2048,  # Connection backlog
         timeout_keep_alive=30,  # Keep connections alive for 30 seconds
@@ -3,22 +3,106 @@ Image annotation utilities for drawing TA elements on charts.
 """
 from PIL import Image, ImageDraw, ImageFont
 import math
-from typing import Dict, List, Optional, Tuple
+import re
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import logging
-import traceback
 
 logger = logging.getLogger(__name__)
 
+# Price patterns for the raw-text fallback when the analysis JSON failed to parse
+_PRICE_RE_LABELED = re.compile(
+    r'(?:price|entry|stop|loss|tp|take.profit|support|resistance)[\s:]*\$?(\d+\.?\d*)', re.IGNORECASE
+)
+_PRICE_RE_GENERIC = re.compile(r'\b(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\b')
 
-def estimate_price_y_position(price: float, min_price: float, max_price: float, 
-                              image_height: int, chart_top: int = 50, 
-                              chart_bottom: int = 50) -> int:
+# Characters stripped from price strings before parsing ("$64,200" -> "64200")
+_PRICE_STRIP_TABLE = str.maketrans('', '', '$, ')
+
+# A cleaned price: a number followed by an optional magnitude suffix
+_PRICE_RE = re.compile(r'([-+]?(?:\d+\.?\d*|\.\d+)(?:E[-+]?\d+)?)(K|THOUSAND|MILLION|MILL|M|B)?')
+_PRICE_TAIL_MULTIPLIERS = {'K': 1000, 'M': 1000000, 'B': 1000000000}
+_PRICE_SUFFIX_MULTIPLIERS = {
+    None: 1,
+    'K': 1000,
+    'THOUSAND': 1000,
+    'M': 1000000,
+    'MILL': 1000000,
+    'MILLION': 1000000,
+    'B': 1000000000,
+}
+
+# Label font sizes
+FONT_LARGE = 16
+FONT_MEDIUM = 14
+FONT_SMALL = 12
+
+
+class LevelStyle(NamedTuple):
+    """How one family of horizontal levels (stop loss, take profits, ...) is drawn"""
+    line_color: Tuple[int, int, int]
+    label_color: Tuple[int, int, int]
+    line_width: int
+    dash: int  # Dash length in px, 0 for a solid line
+    gap: int
+    font_size: int
+    label_side: str  # Label x is measured from 'left' (chart_left) or 'right' (chart_right)
+    label_dx: int
+    label_dy: int
+    pad_x: int
+    pad_y: int
+    border: int
+
+
+STOP_LOSS_STYLE = LevelStyle((255, 0, 0), (255, 0, 0), 5, 0, 0, FONT_MEDIUM, 'left', 15, -20, 8, 6, 4)
+TAKE_PROFIT_STYLE = LevelStyle((0, 150, 255), (0, 200, 255), 4, 0, 0, FONT_MEDIUM, 'right', -112, -15, 6, 4, 3)
+SUPPORT_STYLE = LevelStyle((255, 255, 0), (255, 255, 0), 4, 12, 6, FONT_SMALL, 'left', 10, -18, 4, 3, 2)
+RESISTANCE_STYLE = LevelStyle((255, 165, 0), (255, 165, 0), 4, 12, 6, FONT_SMALL, 'left', 10, -18, 4, 3, 2)
+
+
+class Level(NamedTuple):
+    """A horizontal level ready to draw"""
+    style: LevelStyle
+    label: str
+    price: float
+
+# Label fonts, loaded once per size - parsing the TTF on every annotation is wasted work
+_FONT_CACHE: Dict[int, ImageFont.ImageFont] = {}
+
+# Label font candidates - Arial on Windows, DejaVu Sans on Linux hosts (e.g. Render),
+# where Pillow finds bare file names under the system font directories
+_FONT_PATHS = ("C:/Windows/Fonts/arial.ttf", "arial.ttf", "DejaVuSans.ttf")
+
+# Scratch surface for measuring multi-line labels
+_MEASURE_DRAW = ImageDraw.Draw(Image.new('L', (1, 1)))
+
+
+def _get_font(size: int) -> ImageFont.ImageFont:
+    """Load the first available label font at the given size (falling back to PIL's default font), memoized by size."""
+    font = _FONT_CACHE.get(size)
+    if font is None:
+        for path in _FONT_PATHS:
+            try:
+                font = ImageFont.truetype(path, size)
+                break
+            except OSError:
+                continue
+        else:
+            font = ImageFont.load_default()
+        _FONT_CACHE[size] = font
+    return font
+
+
+def estimate_price_y_positions(prices: List[float], min_price: float, max_price: float,
+                               image_height: int, chart_top: int = 50,
+                               chart_bottom: int = 50) -> List[int]:
     """
-    Estimate Y pixel position for a price level on the chart.
-    Uses linear interpolation with improved accuracy.
+    Estimate Y pixel positions for a batch of price levels on the chart.
+    The chart geometry is validated once and every price is mapped through the
+    same precomputed affine transform.
     
     Args:
-        price: The price value to position
+        prices: The price values to position
         min_price: Minimum price visible on chart
         max_price: Maximum price visible on chart
         image_height: Total image height in pixels
@@ -29,86 +113,97 @@ def estimate_price_y_position(price: float, min_price: float, max_price: float,
     chart_height = chart_bottom - chart_top
     
     if chart_height <= 0:
-        logger.warning(f"⚠️ Invalid chart height: {chart_height} (top={chart_top}, bottom={chart_bottom})")
-        return image_height // 2
+        logger.warning("⚠️ Invalid chart height: %s (top=%s, bottom=%s)", chart_height, chart_top, chart_bottom)
+        return [image_height // 2] * len(prices)
     
     price_range = max_price - min_price
     
     # Ensure minimum price range to avoid division issues
     if price_range <= 0:
-        logger.warning(f"⚠️ Invalid price range: {min_price} - {max_price}, using center")
-        return chart_top + chart_height // 2
-    
-    # Clamp price to valid range to avoid out-of-bounds
-    clamped_price = max(min_price, min(price, max_price))
-    if clamped_price != price:
-        logger.warning(f"⚠️ Price {price} clamped to range [{min_price}, {max_price}] -> {clamped_price}")
-    
-    # Normalize price to 0-1 range (inverted because Y=0 is top)
-    # Higher prices = lower Y position (top of chart)
-    # Lower prices = higher Y position (bottom of chart)
-    # Formula: normalized = (max_price - price) / (max_price - min_price)
-    normalized = (max_price - clamped_price) / price_range
-    
-    # Ensure normalized is between 0 and 1
-    normalized = max(0.0, min(1.0, normalized))
-    
-    # Convert to pixel position within chart area
-    # Use precise calculation: chart_top + (normalized * chart_height)
-    y_pos = chart_top + (normalized * chart_height)
-    
-    # Round to nearest integer for pixel position
-    y_pos = round(y_pos)
-    
-    # Clamp to chart bounds
-    final_y = max(chart_top, min(int(y_pos), chart_bottom))
-    
-    logger.info(f"📍 Price {price:,.2f} -> Y={final_y}px (normalized={normalized:.4f}, chart_height={chart_height}px, range={min_price:,.2f}-{max_price:,.2f})")
+        logger.warning("⚠️ Invalid price range: %s - %s, using center", min_price, max_price)
+        return [chart_top + chart_height // 2] * len(prices)
+    
+    # Affine map from price to pixel row, hoisted out of the loop. Inverted because
+    # Y=0 is the top: higher prices sit higher on the chart (smaller Y)
+    scale = chart_height / price_range
+    offset = chart_top + max_price * scale
+    
+    positions = []
+    for price in prices:
+        # Clamp price to valid range to avoid out-of-bounds
+        clamped_price = max(min_price, min(price, max_price))
+        if clamped_price != price:
+            logger.warning("⚠️ Price %s clamped to range [%s, %s] -> %s", price, min_price, max_price, clamped_price)
+        
+        # Round to the nearest pixel and clamp to chart bounds
+        final_y = max(chart_top, min(round(offset - clamped_price * scale), chart_bottom))
+        
+        logger.debug(
+            "📍 Price %.2f -> Y=%dpx (chart_height=%dpx, range=%.2f-%.2f)",
+            price, final_y, chart_height, min_price, max_price
+        )
+        positions.append(final_y)
     
-    return final_y
+    return positions
 
 
-def parse_price(price_str: str) -> Optional[float]:
-    """Parse price string to float, handling common formats including K/M notation."""
-    if not price_str:
+def estimate_price_y_position(price: float, min_price: float, max_price: float, 
+                              image_height: int, chart_top: int = 50, 
+                              chart_bottom: int = 50) -> int:
+    """Estimate the Y pixel position for a single price level (see estimate_price_y_positions)."""
+    return estimate_price_y_positions([price], min_price, max_price,
+                                      image_height, chart_top, chart_bottom)[0]
+
+
+def parse_price(price_str) -> Optional[float]:
+    """
+    Parse price string to float, handling common formats including K/M notation.
+    Accepts whatever the model put in the JSON (str, int, float or None).
+    """
+    if not price_str or isinstance(price_str, bool):
         return None
+    if isinstance(price_str, (int, float)):
+        # Numbers skip string parsing entirely; NaN/Infinity (which the JSON
+        # decoder accepts) are not usable prices
+        return float(price_str) if math.isfinite(price_str) else None
+    return _parse_price_str(str(price_str))
+
+
+@lru_cache(maxsize=2048)
+def _parse_price_str(price_str: str) -> Optional[float]:
+    """
+    Parse a price string - memoized, since every level is parsed for both the
+    price range and its drawing, and round-number levels recur across charts.
+    """
+    # Remove common characters in a single pass and normalize case
+    cleaned = price_str.translate(_PRICE_STRIP_TABLE).strip().upper()
     
+    # Common case: a bare number or a one-letter suffix, dispatched on the last
+    # character (e.g., "1.5M" = 1.5 * 1000000 = 1500000)
+    multiplier = _PRICE_TAIL_MULTIPLIERS.get(cleaned[-1:], 1)
     try:
-        # Remove common characters and convert to string
-        cleaned = str(price_str).replace('$', '').replace(',', '').replace(' ', '').strip().upper()
-        
-        # Handle various notation formats
-        multiplier = 1
-        
-        # Check for "MILLION" or "MILL" text
-        if 'MILLION' in cleaned or 'MILL' in cleaned:
-            cleaned = cleaned.replace('MILLION', '').replace('MILL', '')
-            multiplier = 1000000
-        # Check for "THOUSAND" or "K" notation
-        elif cleaned.endswith('K') or 'THOUSAND' in cleaned:
-            if cleaned.endswith('K'):
-                cleaned = cleaned[:-1]
-            else:
-                cleaned = cleaned.replace('THOUSAND', '')
-            multiplier = 1000
-        # Check for "M" notation (million)
-        elif cleaned.endswith('M'):
-            multiplier = 1000000
-            cleaned = cleaned[:-1]
-        # Check for "B" notation (billion)
-        elif cleaned.endswith('B'):
-            multiplier = 1000000000
-            cleaned = cleaned[:-1]
-        
-        # Handle decimal numbers (e.g., "1.5M" = 1.5 * 1000000 = 1500000)
-        price_value = float(cleaned)
-        result = price_value * multiplier
-        
-        logger.debug(f"Parsed price '{price_str}' -> {price_value} * {multiplier} = {result}")
-        return result
-    except (ValueError, AttributeError) as e:
-        logger.warning(f"Failed to parse price '{price_str}': {e}")
+        price_value = float(cleaned[:-1] if multiplier != 1 else cleaned)
+    except ValueError:
+        # Spelled-out suffixes ("12THOUSAND", "3MILLION") go through the full pattern
+        match = _PRICE_RE.fullmatch(cleaned)
+        if match is None:
+            logger.warning("Failed to parse price '%s'", price_str)
+            return None
+        price_value = float(match.group(1))
+        multiplier = _PRICE_SUFFIX_MULTIPLIERS[match.group(2)]
+    result = price_value * multiplier
+    if not math.isfinite(result):
+        # "nan", "inf" and overflowing values parse as floats but aren't prices
+        logger.warning("Failed to parse price '%s'", price_str)
         return None
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Parsed price '%s' -> %s * %s = %s", price_str, price_value, multiplier, result)
+    return result
+
+
+# Analysis keys holding price levels, besides current_price
+_LEVEL_KEYS = ('entry', 'stop_loss', 'take_profits', 'support_levels', 'resistance_levels')
 
 
 def get_price_range(analysis: Dict) -> Tuple[float, float]:
@@ -119,59 +214,47 @@ def get_price_range(analysis: Dict) -> Tuple[float, float]:
     2. Use min/max of all prices in analysis
     3. Fallback to defaults
     """
-    prices = []
-    price_strings = []  # Keep original strings for debugging
-    
     # FIRST PRIORITY: Use chart's visible price range if provided (most accurate)
     chart_min = analysis.get('chart_min_price')
     chart_max = analysis.get('chart_max_price')
     
     if chart_min and chart_max:
-        parsed_min = parse_price(str(chart_min))
-        parsed_max = parse_price(str(chart_max))
+        parsed_min = parse_price(chart_min)
+        parsed_max = parse_price(chart_max)
         if parsed_min is not None and parsed_max is not None and parsed_min < parsed_max:
             # Use the chart's visible range directly - this is the most accurate
-            logger.info(f"✅ Using chart's visible price range: {parsed_min:,.2f} - {parsed_max:,.2f}")
+            logger.debug("✅ Using chart's visible price range: %.2f - %.2f", parsed_min, parsed_max)
             # Add minimal padding (1-2%) to ensure all levels are visible
             price_range = parsed_max - parsed_min
             small_padding = price_range * 0.01  # 1% padding
             return parsed_min - small_padding, parsed_max + small_padding
         else:
-            logger.warning(f"⚠️ Invalid chart price range: {chart_min} - {chart_max}, falling back to analysis prices")
-    
-    # SECOND PRIORITY: Collect all price values from analysis
-    def add_price(price_str, source=""):
-        if price_str:
-            parsed = parse_price(str(price_str))
-            if parsed is not None:
-                prices.append(parsed)
-                price_strings.append(f"{price_str} ({source}) -> {parsed}")
-    
-    if analysis.get('current_price'):
-        add_price(analysis['current_price'], 'current_price')
-    
-    if analysis.get('entry') and analysis['entry'].get('price'):
-        add_price(analysis['entry']['price'], 'entry')
-    
-    if analysis.get('stop_loss') and analysis['stop_loss'].get('price'):
-        add_price(analysis['stop_loss']['price'], 'stop_loss')
-    
-    if analysis.get('take_profits'):
-        for tp in analysis['take_profits']:
-            if tp.get('price'):
-                add_price(tp['price'], 'take_profit')
-    
-    if analysis.get('support_levels'):
-        for level in analysis['support_levels']:
-            if level.get('price'):
-                add_price(level['price'], 'support')
-    
-    if analysis.get('resistance_levels'):
-        for level in analysis['resistance_levels']:
-            if level.get('price'):
-                add_price(level['price'], 'resistance')
-    
-    logger.info(f"📊 Collected {len(prices)} prices: {price_strings[:10]}")
+            logger.warning("⚠️ Invalid chart price range: %s - %s, falling back to analysis prices", chart_min, chart_max)
+    
+    # Fast path: no levels at all (common when the model's JSON only partly parsed),
+    # so current_price is the only possible price
+    if not any(analysis.get(key) for key in _LEVEL_KEYS):
+        base = parse_price(analysis.get('current_price'))
+        if base is None:
+            logger.warning("⚠️ No prices found, using default range 0-100")
+            return 0, 100
+        logger.warning("⚠️ Only one price found (%s), using range: %s - %s", base, base * 0.8, base * 1.2)
+        return base * 0.8, base * 1.2
+    
+    # SECOND PRIORITY: Collect all price values from analysis in one pass
+    entry = analysis.get('entry') or {}
+    stop_loss = analysis.get('stop_loss') or {}
+    raw_prices = [
+        analysis.get('current_price'),
+        entry.get('price'),
+        stop_loss.get('price'),
+        *(tp.get('price') for tp in analysis.get('take_profits') or ()),
+        *(level.get('price') for level in analysis.get('support_levels') or ()),
+        *(level.get('price') for level in analysis.get('resistance_levels') or ()),
+    ]
+    prices = [price for price in map(parse_price, raw_prices) if price is not None]
+    
+    logger.debug("📊 Collected %d prices: %s", len(prices), prices[:10])
     
     if len(prices) < 2:
         # Default range if we can't determine
@@ -179,7 +262,7 @@ def get_price_range(analysis: Dict) -> Tuple[float, float]:
             base = prices[0]
             # Use wider range for single price
             range_pct = 0.2  # 20% above and below
-            logger.warning(f"⚠️ Only one price found ({base}), using range: {base * (1 - range_pct)} - {base * (1 + range_pct)}")
+            logger.warning("⚠️ Only one price found (%s), using range: %s - %s", base, base * (1 - range_pct), base * (1 + range_pct))
             return base * (1 - range_pct), base * (1 + range_pct)
         logger.warning("⚠️ No prices found, using default range 0-100")
         return 0, 100
@@ -192,7 +275,7 @@ def get_price_range(analysis: Dict) -> Tuple[float, float]:
     
     # Ensure minimum price range to avoid issues
     if price_range <= 0:
-        logger.warning(f"⚠️ Invalid price range: {min_price} - {max_price}")
+        logger.warning("⚠️ Invalid price range: %s - %s", min_price, max_price)
         if min_price > 0:
             price_range = min_price * 0.2  # Use 20% of min_price as range
             max_price = min_price + price_range
@@ -220,12 +303,64 @@ def get_price_range(analysis: Dict) -> Tuple[float, float]:
     if result_min < 0:
         result_min = 0
     
-    logger.info(f"💰 Price range: {min_price:,.2f} - {max_price:,.2f} (range: {price_range:,.2f})")
-    logger.info(f"📏 With {padding_pct*100}% padding: {result_min:,.2f} - {result_max:,.2f}")
+    logger.debug("💰 Price range: %.2f - %.2f (range: %.2f)", min_price, max_price, price_range)
+    logger.debug("📏 With %s%% padding: %.2f - %.2f", padding_pct * 100, result_min, result_max)
     
     return result_min, result_max
 
 
+@lru_cache(maxsize=64)
+def _dash_mask(length: int, dash: int, gap: int, width: int) -> Image.Image:
+    """Build (once per geometry) an 'L' mask of a horizontal dashed stroke."""
+    # Matches the old per-dash draw.line calls, whose end points were inclusive
+    pattern = b"\xff" * (dash + 1) + b"\x00" * (gap - 1)
+    row = (pattern * (length // len(pattern) + 1))[:length]
+    return Image.frombytes('L', (length, width), row * width)
+
+
+def _draw_dashed_hline(image: Image.Image, x0: int, x1: int, y: int, dash: int, gap: int,
+                       color: Tuple[int, int, int], width: int):
+    """
+    Draw a horizontal dashed line from x0 to x1 centred on y.
+    All dashes are stamped with a single paste through a cached mask instead of
+    one draw.line call per dash.
+    """
+    length = x1 - x0 + 1
+    if length <= 0:
+        return
+    # Same vertical extent as draw.line(..., width=width)
+    top = y - (width - 1) // 2
+    image.paste(color, (x0, top, x0 + length, top + width), _dash_mask(length, dash, gap, width))
+
+
+@lru_cache(maxsize=256)
+def _render_label(text: str, font_size: int, fg: Tuple[int, int, int], outline: Tuple[int, int, int],
+                  pad_x: int, pad_y: int, border: int) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Render a label (black box, colored border, text) into a reusable tile.
+    Returns the tile and its offset from the text anchor point.
+    """
+    font = _get_font(font_size)
+    if "\n" in text:
+        left, top, right, bottom = _MEASURE_DRAW.multiline_textbbox((0, 0), text, font=font)
+    else:
+        # Single-line labels are measured straight from the font, with no layout pass
+        left, top, right, bottom = font.getbbox(text)
+    tile = Image.new('RGB', (right - left + 2 * pad_x + 1, bottom - top + 2 * pad_y + 1), (0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    draw.rectangle([(0, 0), (tile.width - 1, tile.height - 1)], fill=(0, 0, 0), outline=outline, width=border)
+    draw.text((pad_x - left, pad_y - top), text, fill=fg, font=font)
+    return tile, (left - pad_x, top - pad_y)
+
+
+def _draw_label(image: Image.Image, x: int, y: int, text: str, font_size: int,
+                fg: Tuple[int, int, int], outline: Tuple[int, int, int],
+                pad_x: int, pad_y: int, border: int):
+    """Paste a pre-rendered label whose text is anchored at (x, y)."""
+    tile, (dx, dy) = _render_label(text, font_size, fg, outline, pad_x, pad_y, border)
+    image.paste(tile, (x + dx, y + dy))
+
+
 def draw_arrow(draw: ImageDraw.Draw, x: int, y: int, direction: str = 'up', 
                color: Tuple[int, int, int] = (0, 255, 0), size: int = 20):
     """Draw an arrow pointing up or down."""
@@ -255,14 +390,56 @@ def draw_arrow(draw: ImageDraw.Draw, x: int, y: int, direction: str = 'up',
     draw.polygon(points, fill=color, outline=color)
 
 
-def annotate_chart(image: Image.Image, analysis: Dict) -> Image.Image:
+@lru_cache(maxsize=16)
+def _arrow_mask(direction: str, size: int) -> Image.Image:
+    """Rasterize the arrow polygon once per shape into an 'L' mask centred at (size, size)."""
+    mask = Image.new('L', (2 * size + 1, 2 * size + 1), 0)
+    draw_arrow(ImageDraw.Draw(mask), size, size, direction=direction, color=255, size=size)
+    return mask
+
+
+def paste_arrow(image: Image.Image, x: int, y: int, direction: str = 'up',
+                color: Tuple[int, int, int] = (0, 255, 0), size: int = 20):
+    """Same arrow as draw_arrow, stamped from a cached mask instead of rasterized per call."""
+    image.paste(color, (x - size, y - size), _arrow_mask(direction, size))
+
+
+def _collect_levels(analysis: Dict) -> List[Level]:
+    """
+    Flatten the stop loss, take profits, supports and resistances into Level
+    records, in drawing order, dropping levels whose price is missing or
+    unparseable.
+    """
+    levels = []  # (style, label text, raw price)
+    stop_loss = analysis.get('stop_loss')
+    if stop_loss and stop_loss.get('price'):
+        levels.append((STOP_LOSS_STYLE, f"STOP LOSS: {stop_loss['price']}", stop_loss['price']))
+    for idx, tp in enumerate(analysis.get('take_profits') or []):
+        if tp.get('price'):
+            levels.append((TAKE_PROFIT_STYLE, f"TP{idx + 1}: {tp['price']}", tp['price']))
+    for level in (analysis.get('support_levels') or [])[:5]:  # Show up to 5
+        if level.get('price'):
+            levels.append((SUPPORT_STYLE, f"Support: {level['price']}", level['price']))
+    for level in (analysis.get('resistance_levels') or [])[:5]:  # Show up to 5
+        if level.get('price'):
+            levels.append((RESISTANCE_STYLE, f"Resistance: {level['price']}", level['price']))
+    return [Level(style, label, price) for style, label, raw in levels if (price := parse_price(raw))]
+
+
+def annotate_chart(image: Image.Image, analysis: Dict, *, copy: bool = True) -> Image.Image:
     """
     Annotate a chart image with TA analysis.
+    
+    Args:
+        image: Chart image to annotate
+        analysis: Parsed analysis JSON from the model
+        copy: Draw on a copy of an RGB input. Pass False when the caller no
+            longer needs the original - the input image is then mutated.
     """
     # Handle case where analysis is just raw text (parsing failed)
     if not isinstance(analysis, dict):
         logger.warning("Analysis is not a dict, returning original image")
-        return image.copy()
+        return image.copy() if copy else image
     
     # Force annotation - even if parsed=False, try to use what we have
     has_data = any([
@@ -274,21 +451,23 @@ def annotate_chart(image: Image.Image, analysis: Dict) -> Image.Image:
         analysis.get('current_price')
     ])
     
-    logger.info(f"🔍 Checking for annotation data - Has entry: {bool(analysis.get('entry'))}, Has SL: {bool(analysis.get('stop_loss'))}, Has TPs: {bool(analysis.get('take_profits'))}, Has supports: {bool(analysis.get('support_levels'))}, Has resistances: {bool(analysis.get('resistance_levels'))}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "🔍 Checking for annotation data - Has entry: %s, Has SL: %s, Has TPs: %s, Has supports: %s, Has resistances: %s",
+            bool(analysis.get('entry')), bool(analysis.get('stop_loss')), bool(analysis.get('take_profits')),
+            bool(analysis.get('support_levels')), bool(analysis.get('resistance_levels'))
+        )
     
     # If parsed=False but we have raw_text, try to extract prices
     if not has_data and analysis.get('parsed') == False and analysis.get('raw_text'):
-        import re
         logger.info("📝 Attempting to extract prices from raw text...")
-        # More comprehensive price pattern
-        price_pattern = r'(?:price|entry|stop|loss|tp|take.profit|support|resistance)[\s:]*\$?(\d+\.?\d*)'
-        prices = re.findall(price_pattern, analysis.get('raw_text', ''), re.IGNORECASE)
+        raw_text = analysis.get('raw_text', '')
+        prices = _PRICE_RE_LABELED.findall(raw_text)
         if not prices:
             # Fallback: find any numbers that look like prices
-            price_pattern = r'\b(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\b'
-            prices = re.findall(price_pattern, analysis.get('raw_text', ''))
+            prices = _PRICE_RE_GENERIC.findall(raw_text)
         
-        logger.info(f"📊 Extracted {len(prices)} prices from raw text: {prices[:5]}")
+        logger.info("📊 Extracted %d prices from raw text: %s", len(prices), prices[:5])
         
         if prices:
             # Create structure for annotation
@@ -303,15 +482,15 @@ def annotate_chart(image: Image.Image, analysis: Dict) -> Image.Image:
     # ALWAYS try to annotate if we have ANY price data - even just support/resistance
     if not has_data:
         logger.warning("⚠️ No price data found for annotation, returning original image")
-        return image.copy()
+        return image.copy() if copy else image
     
-    logger.info("✅ Proceeding with annotation - data found!")
+    logger.debug("✅ Proceeding with annotation - data found!")
     
-    # Create a copy to draw on (ensure RGB mode)
+    # Get an RGB image to draw on - convert() already returns a new image
     if image.mode != 'RGB':
-        annotated = image.convert('RGB').copy()
+        annotated = image.convert('RGB')
     else:
-        annotated = image.copy()
+        annotated = image.copy() if copy else image
     draw = ImageDraw.Draw(annotated)
     
     width, height = image.size
@@ -319,30 +498,30 @@ def annotate_chart(image: Image.Image, analysis: Dict) -> Image.Image:
     # Try to get price range
     try:
         min_price, max_price = get_price_range(analysis)
-        logger.info(f"✅ Price range determined: {min_price:,.2f} - {max_price:,.2f}")
+        logger.debug("✅ Price range determined: %.2f - %.2f", min_price, max_price)
         
         # Validate price range
         if min_price >= max_price:
-            logger.error(f"❌ Invalid price range: {min_price} >= {max_price}")
+            logger.error("❌ Invalid price range: %s >= %s", min_price, max_price)
             # Try to fix by using a percentage range around the prices
             all_prices = []
             for key in ['current_price', 'entry', 'stop_loss']:
                 if analysis.get(key) and isinstance(analysis[key], dict) and analysis[key].get('price'):
-                    p = parse_price(str(analysis[key]['price']))
+                    p = parse_price(analysis[key]['price'])
                     if p: all_prices.append(p)
             if analysis.get('take_profits'):
                 for tp in analysis['take_profits']:
-                    p = parse_price(str(tp.get('price', '')))
+                    p = parse_price(tp.get('price'))
                     if p: all_prices.append(p)
             if all_prices:
                 avg_price = sum(all_prices) / len(all_prices)
                 min_price = avg_price * 0.8
                 max_price = avg_price * 1.2
-                logger.warning(f"⚠️ Fixed range using average: {min_price:,.2f} - {max_price:,.2f}")
+                logger.warning("⚠️ Fixed range using average: %.2f - %.2f", min_price, max_price)
             else:
                 min_price, max_price = 0, 100
     except Exception as e:
-        logger.error(f"❌ Could not determine price range: {e}\n{traceback.format_exc()}")
+        logger.error("❌ Could not determine price range: %s", e, exc_info=True)
         min_price, max_price = 0, 100
     
     # Estimate chart area (use most of the image, but be more conservative)
@@ -358,195 +537,60 @@ def annotate_chart(image: Image.Image, analysis: Dict) -> Image.Image:
     chart_bottom = height - chart_bottom_margin  # Bottom of chart area (pixels from top)
     chart_height = chart_bottom - chart_top  # Actual chart height
     
-    logger.info(f"📐 Chart dimensions: {width}x{height}px")
-    logger.info(f"📊 Chart area: X={chart_left}-{chart_right}px, Y={chart_top}-{chart_bottom}px (height: {chart_height}px)")
-    logger.info(f"💰 Price range: {min_price:,.2f} - {max_price:,.2f} (range: {max_price - min_price:,.2f})")
-    logger.info(f"📈 Chart elements: Entry={bool(analysis.get('entry'))}, SL={bool(analysis.get('stop_loss'))}, TPs={len(analysis.get('take_profits', []))}")
-    
-    # Get font
-    try:
-        font_large = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 16)
-        font_medium = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 14)
-        font_small = ImageFont.truetype("C:/Windows/Fonts/arial.ttf", 12)
-    except:
-        try:
-            font_large = ImageFont.truetype("arial.ttf", 16)
-            font_medium = ImageFont.truetype("arial.ttf", 14)
-            font_small = ImageFont.truetype("arial.ttf", 12)
-        except:
-            font_large = ImageFont.load_default()
-            font_medium = ImageFont.load_default()
-            font_small = ImageFont.load_default()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📐 Chart dimensions: %dx%dpx", width, height)
+        logger.debug(
+            "📊 Chart area: X=%d-%dpx, Y=%d-%dpx (height: %dpx)",
+            chart_left, chart_right, chart_top, chart_bottom, chart_height
+        )
+        logger.debug("💰 Price range: %.2f - %.2f (range: %.2f)", min_price, max_price, max_price - min_price)
+        logger.debug(
+            "📈 Chart elements: Entry=%s, SL=%s, TPs=%d",
+            bool(analysis.get('entry')), bool(analysis.get('stop_loss')), len(analysis.get('take_profits') or [])
+        )
+    
+    # Every horizontal level, flattened up front in drawing order
+    levels = _collect_levels(analysis)
+    
+    entry = analysis.get('entry')
+    entry_price = parse_price(entry.get('price')) if entry else None
+    
+    # Map all prices to pixel rows in one batch
+    y_positions = estimate_price_y_positions(
+        ([entry_price] if entry_price else []) + [level.price for level in levels],
+        min_price, max_price, height, chart_top, chart_bottom
+    )
     
     # Entry point (green arrow) - draw on right side
-    if analysis.get('entry') and analysis['entry'].get('price'):
-        entry_price = parse_price(str(analysis['entry']['price']))
-        if entry_price:
-            entry_y = estimate_price_y_position(entry_price, min_price, max_price, 
-                                               height, chart_top, chart_bottom)
-            entry_x = int(width * 0.75)  # Right side of chart
-            
-            logger.info(f"Drawing entry at price {entry_price}, Y position: {entry_y}")
-            
-            # Draw green arrow pointing up
-            draw_arrow(draw, entry_x, entry_y, direction='up', 
-                      color=(0, 255, 0), size=35)
-            
-            # Label with background
-            entry_label = f"ENTRY\n{analysis['entry']['price']}"
-            try:
-                bbox = draw.textbbox((entry_x + 25, entry_y - 50), entry_label, font=font_large)
-            except AttributeError:
-                bbox = draw.textsize(entry_label, font=font_large)
-                bbox = (entry_x + 25, entry_y - 50, entry_x + 25 + bbox[0], entry_y - 50 + bbox[1])
-            # Draw background
-            draw.rectangle([(bbox[0] - 8, bbox[1] - 6), (bbox[2] + 8, bbox[3] + 6)], 
-                          fill=(0, 0, 0), outline=(0, 255, 0), width=3)
-            draw.text((entry_x + 25, entry_y - 50), entry_label, 
-                     fill=(0, 255, 0), font=font_large)
-    
-    # Stop Loss (red line) - make it very visible
-    if analysis.get('stop_loss') and analysis['stop_loss'].get('price'):
-        sl_price = parse_price(str(analysis['stop_loss']['price']))
-        if sl_price:
-            sl_y = estimate_price_y_position(sl_price, min_price, max_price, 
-                                            height, chart_top, chart_bottom)
-            
-            logger.info(f"Drawing stop loss at price {sl_price}, Y position: {sl_y}")
-            
-            # Draw red horizontal line (thick)
-            draw.line([(chart_left, sl_y), (chart_right, sl_y)], 
-                     fill=(255, 0, 0), width=5)
-            
-            # Dashed line effect
-            dash_length = 15
-            gap_length = 10
-            x = chart_left
-            while x < chart_right:
-                end_x = min(x + dash_length, chart_right)
-                draw.line([(x, sl_y), (end_x, sl_y)], fill=(255, 0, 0), width=5)
-                x += dash_length + gap_length
-            
-            # Label on left side
-            label_text = f"STOP LOSS: {analysis['stop_loss']['price']}"
-            try:
-                bbox = draw.textbbox((chart_left + 15, sl_y - 20), label_text, font=font_medium)
-            except AttributeError:
-                bbox = draw.textsize(label_text, font=font_medium)
-                bbox = (chart_left + 15, sl_y - 20, chart_left + 15 + bbox[0], sl_y - 20 + bbox[1])
-            # Draw background with border
-            draw.rectangle([(bbox[0] - 8, bbox[1] - 6), (bbox[2] + 8, bbox[3] + 6)], 
-                          fill=(0, 0, 0), outline=(255, 0, 0), width=4)
-            draw.text((chart_left + 15, sl_y - 20), label_text, 
-                     fill=(255, 0, 0), font=font_medium)
-    
-    # Take Profit levels (blue lines) - make very visible
-    if analysis.get('take_profits'):
-        for idx, tp in enumerate(analysis['take_profits']):
-            if tp.get('price'):
-                tp_price = parse_price(str(tp['price']))
-                if tp_price:
-                    tp_y = estimate_price_y_position(tp_price, min_price, max_price, 
-                                                    height, chart_top, chart_bottom)
-                    
-                    logger.info(f"Drawing TP{idx+1} at price {tp_price}, Y position: {tp_y}")
-                    
-                    # Draw blue horizontal line (thick)
-                    draw.line([(chart_left, tp_y), (chart_right, tp_y)], 
-                             fill=(0, 150, 255), width=4)
-                    
-                    # Dashed line effect
-                    dash_length = 12
-                    gap_length = 8
-                    x = chart_left
-                    while x < chart_right:
-                        end_x = min(x + dash_length, chart_right)
-                        draw.line([(x, tp_y), (end_x, tp_y)], fill=(0, 150, 255), width=4)
-                        x += dash_length + gap_length
-                    
-                    # Label on right side
-                    label_x = chart_right - 120
-                    label_text = f"TP{idx + 1}: {tp['price']}"
-                    try:
-                        bbox = draw.textbbox((label_x + 8, tp_y - 15), label_text, font=font_medium)
-                    except AttributeError:
-                        bbox = draw.textsize(label_text, font=font_medium)
-                        bbox = (label_x + 8, tp_y - 15, label_x + 8 + bbox[0], tp_y - 15 + bbox[1])
-                    # Draw background
-                    draw.rectangle([(bbox[0] - 6, bbox[1] - 4), (bbox[2] + 6, bbox[3] + 4)], 
-                                  fill=(0, 0, 0), outline=(0, 150, 255), width=3)
-                    draw.text((label_x + 8, tp_y - 15), label_text, 
-                             fill=(0, 200, 255), font=font_medium)
-    
-    # Support levels (yellow dashed lines) - ALWAYS draw these
-    if analysis.get('support_levels'):
-        logger.info(f"📈 Drawing {len(analysis['support_levels'])} support levels")
-        for idx, level in enumerate(analysis['support_levels'][:5]):  # Show up to 5
-            if level.get('price'):
-                support_price = parse_price(str(level['price']))
-                if support_price:
-                    support_y = estimate_price_y_position(support_price, min_price, max_price, 
-                                                         height, chart_top, chart_bottom)
-                    
-                    logger.info(f"  → Support {idx+1}: {level['price']} ({support_price}) at Y={support_y}")
-                    
-                    # Draw yellow dashed line (thicker, more visible)
-                    dash_length = 12
-                    gap_length = 6
-                    x = chart_left
-                    while x < chart_right:
-                        end_x = min(x + dash_length, chart_right)
-                        draw.line([(x, support_y), (end_x, support_y)], 
-                                 fill=(255, 255, 0), width=4)
-                        x += dash_length + gap_length
-                    
-                    # Always add label with background
-                    label_text = f"Support: {level['price']}"
-                    try:
-                        bbox = draw.textbbox((chart_left + 10, support_y - 18), label_text, font=font_small)
-                    except AttributeError:
-                        bbox = draw.textsize(label_text, font=font_small)
-                        bbox = (chart_left + 10, support_y - 18, chart_left + 10 + bbox[0], support_y - 18 + bbox[1])
-                    # Draw background
-                    draw.rectangle([(bbox[0] - 4, bbox[1] - 3), (bbox[2] + 4, bbox[3] + 3)], 
-                                  fill=(0, 0, 0), outline=(255, 255, 0), width=2)
-                    draw.text((chart_left + 10, support_y - 18), label_text, 
-                             fill=(255, 255, 0), font=font_small)
-    
-    # Resistance levels (orange dashed lines) - ALWAYS draw these
-    if analysis.get('resistance_levels'):
-        logger.info(f"📉 Drawing {len(analysis['resistance_levels'])} resistance levels")
-        for idx, level in enumerate(analysis['resistance_levels'][:5]):  # Show up to 5
-            if level.get('price'):
-                resistance_price = parse_price(str(level['price']))
-                if resistance_price:
-                    resistance_y = estimate_price_y_position(resistance_price, min_price, max_price, 
-                                                            height, chart_top, chart_bottom)
-                    
-                    logger.info(f"  → Resistance {idx+1}: {level['price']} ({resistance_price}) at Y={resistance_y}")
-                    
-                    # Draw orange dashed line (thicker, more visible)
-                    dash_length = 12
-                    gap_length = 6
-                    x = chart_left
-                    while x < chart_right:
-                        end_x = min(x + dash_length, chart_right)
-                        draw.line([(x, resistance_y), (end_x, resistance_y)], 
-                                 fill=(255, 165, 0), width=4)
-                        x += dash_length + gap_length
-                    
-                    # Always add label with background
-                    label_text = f"Resistance: {level['price']}"
-                    try:
-                        bbox = draw.textbbox((chart_left + 10, resistance_y - 18), label_text, font=font_small)
-                    except AttributeError:
-                        bbox = draw.textsize(label_text, font=font_small)
-                        bbox = (chart_left + 10, resistance_y - 18, chart_left + 10 + bbox[0], resistance_y - 18 + bbox[1])
-                    # Draw background
-                    draw.rectangle([(bbox[0] - 4, bbox[1] - 3), (bbox[2] + 4, bbox[3] + 3)], 
-                                  fill=(0, 0, 0), outline=(255, 165, 0), width=2)
-                    draw.text((chart_left + 10, resistance_y - 18), label_text, 
-                             fill=(255, 165, 0), font=font_small)
-    
-    logger.info("✅ Annotation complete! Returning annotated image.")
+    if entry_price:
+        entry_y = y_positions.pop(0)
+        entry_x = int(width * 0.75)  # Right side of chart
+        
+        logger.debug("Drawing entry at price %s, Y position: %d", entry_price, entry_y)
+        
+        # Draw green arrow pointing up
+        paste_arrow(annotated, entry_x, entry_y, direction='up', 
+                    color=(0, 255, 0), size=35)
+        
+        # Label with background
+        entry_label = f"ENTRY\n{entry['price']}"
+        _draw_label(annotated, entry_x + 25, entry_y - 50, entry_label, FONT_LARGE,
+                    (0, 255, 0), (0, 255, 0), 8, 6, 3)
+    
+    # Stop loss (red), take profits (blue), supports (yellow dashed), resistances (orange dashed)
+    for level, y in zip(levels, y_positions):
+        style = level.style
+        logger.debug("Drawing %s (%s) at Y=%d", level.label, level.price, y)
+        
+        if style.dash:
+            _draw_dashed_hline(annotated, chart_left, chart_right, y, style.dash, style.gap,
+                               style.line_color, style.line_width)
+        else:
+            draw.line([(chart_left, y), (chart_right, y)], fill=style.line_color, width=style.line_width)
+        
+        label_x = (chart_left if style.label_side == 'left' else chart_right) + style.label_dx
+        _draw_label(annotated, label_x, y + style.label_dy, level.label, style.font_size,
+                    style.label_color, style.line_color, style.pad_x, style.pad_y, style.border)
+    
+    logger.debug("✅ Annotation complete! Returning annotated image.")
     return annotated
@@ -1,76 +1,92 @@
 """
 Technical Analysis prompt templates for Gemini vision model.
 """
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Optional
 
-def get_ta_prompt(
-    timeframe: Optional[str] = None,
-    asset_type: Optional[str] = None,
-    trade_direction: Optional[str] = None
-) -> str:
-    """
-    Returns the main technical analysis prompt for chart analysis.
-    
-    Args:
-        timeframe: Optional timeframe to include in the prompt (1m, 5m, 15m, 1h, 4h, 1d, 1w, 1M)
-        asset_type: Optional asset type (btc, sol, eth, alts, memecoin)
-        trade_direction: Optional trade direction ('long' or 'short')
-    """
-    timeframe_context = ""
-    if timeframe and timeframe != "auto":
-        timeframe_map = {
-            "1s": "1-second (ultra-scalping)",
-            "3s": "3-second (ultra-scalping)",
-            "5s": "5-second (ultra-scalping)",
-            "15s": "15-second (ultra-scalping)",
-            "30s": "30-second (ultra-scalping)",
-            "1m": "1-minute (scalping)",
-            "3m": "3-minute (scalping)",
-            "5m": "5-minute (short-term trading)",
-            "15m": "15-minute (intraday trading)",
-            "30m": "30-minute (intraday trading)",
-            "1h": "1-hour (swing trading)",
-            "2h": "2-hour (swing trading)",
-            "4h": "4-hour (swing trading)",
-            "12h": "12-hour (swing trading)",
-            "1d": "daily (position trading)",
-            "3d": "3-day (position trading)",
-            "1w": "weekly (long-term investing)",
-            "1M": "monthly (long-term investing)"
-        }
-        tf_desc = timeframe_map.get(timeframe, timeframe)
-        timeframe_context = f"\n\n**IMPORTANT: This chart is a {tf_desc} timeframe.** Adjust your analysis accordingly:\n"
-        if timeframe in ["1s", "3s", "5s", "15s", "30s"]:
-            timeframe_context += "- ULTRA-SHORT timeframe - extreme scalping, very quick entries/exits\n"
-            timeframe_context += "- Use VERY tight stop-losses (0.1-0.5%)\n"
-            timeframe_context += "- Focus on micro price action and order flow\n"
-            timeframe_context += "- High frequency trading approach - quick profits, quick exits\n"
-        elif timeframe in ["1m", "3m", "5m", "15m"]:
-            timeframe_context += "- Focus on short-term price action and quick scalping opportunities\n"
-            timeframe_context += "- Use tighter stop-losses (0.5-1%)\n"
-            timeframe_context += "- Look for quick momentum plays and breakouts\n"
-        elif timeframe in ["30m", "1h", "2h"]:
-            timeframe_context += "- Balance between intraday and swing trading strategies\n"
-            timeframe_context += "- Use moderate stop-losses (1-2%)\n"
-            timeframe_context += "- Focus on trend continuation and key support/resistance\n"
-        elif timeframe in ["4h", "12h"]:
-            timeframe_context += "- Focus on swing trading setups\n"
-            timeframe_context += "- Use wider stop-losses (2-3%)\n"
-            timeframe_context += "- Look for major trend reversals and continuation patterns\n"
-        elif timeframe in ["1d", "3d"]:
-            timeframe_context += "- Focus on position trading and major trends\n"
-            timeframe_context += "- Use wider stop-losses (3-5%)\n"
-            timeframe_context += "- Prioritize major support/resistance and trend analysis\n"
-        elif timeframe in ["1w", "1M"]:
-            timeframe_context += "- Focus on long-term investment opportunities\n"
-            timeframe_context += "- Use very wide stop-losses (5-10%)\n"
-            timeframe_context += "- Analyze major market structure and long-term trends\n"
-    
-    # Asset-specific context
-    asset_context = ""
-    if asset_type:
-        asset_context_map = {
-            "btc": """
+
+# Everything below is static, so it is built once at import time and
+# get_ta_prompt only has to pick the context blocks and join them. The
+# lookup tables are read-only views shared by every caller.
+
+_TIMEFRAME_MAP = MappingProxyType({
+    "1s": "1-second (ultra-scalping)",
+    "3s": "3-second (ultra-scalping)",
+    "5s": "5-second (ultra-scalping)",
+    "15s": "15-second (ultra-scalping)",
+    "30s": "30-second (ultra-scalping)",
+    "1m": "1-minute (scalping)",
+    "3m": "3-minute (scalping)",
+    "5m": "5-minute (short-term trading)",
+    "15m": "15-minute (intraday trading)",
+    "30m": "30-minute (intraday trading)",
+    "1h": "1-hour (swing trading)",
+    "2h": "2-hour (swing trading)",
+    "4h": "4-hour (swing trading)",
+    "12h": "12-hour (swing trading)",
+    "1d": "daily (position trading)",
+    "3d": "3-day (position trading)",
+    "1w": "weekly (long-term investing)",
+    "1M": "monthly (long-term investing)"
+})
+
+_TF_ULTRA_SUFFIX = (
+    "- ULTRA-SHORT timeframe - extreme scalping, very quick entries/exits\n"
+    "- Use VERY tight stop-losses (0.1-0.5%)\n"
+    "- Focus on micro price action and order flow\n"
+    "- High frequency trading approach - quick profits, quick exits\n"
+)
+_TF_SCALP_SUFFIX = (
+    "- Focus on short-term price action and quick scalping opportunities\n"
+    "- Use tighter stop-losses (0.5-1%)\n"
+    "- Look for quick momentum plays and breakouts\n"
+)
+_TF_INTRADAY_SUFFIX = (
+    "- Balance between intraday and swing trading strategies\n"
+    "- Use moderate stop-losses (1-2%)\n"
+    "- Focus on trend continuation and key support/resistance\n"
+)
+_TF_SWING_SUFFIX = (
+    "- Focus on swing trading setups\n"
+    "- Use wider stop-losses (2-3%)\n"
+    "- Look for major trend reversals and continuation patterns\n"
+)
+_TF_POSITION_SUFFIX = (
+    "- Focus on position trading and major trends\n"
+    "- Use wider stop-losses (3-5%)\n"
+    "- Prioritize major support/resistance and trend analysis\n"
+)
+_TF_LONG_TERM_SUFFIX = (
+    "- Focus on long-term investment opportunities\n"
+    "- Use very wide stop-losses (5-10%)\n"
+    "- Analyze major market structure and long-term trends\n"
+)
+
+# Timeframe code -> the guidance lines for its trading-style bucket
+_TIMEFRAME_SUFFIX = MappingProxyType({
+    "1s": _TF_ULTRA_SUFFIX,
+    "3s": _TF_ULTRA_SUFFIX,
+    "5s": _TF_ULTRA_SUFFIX,
+    "15s": _TF_ULTRA_SUFFIX,
+    "30s": _TF_ULTRA_SUFFIX,
+    "1m": _TF_SCALP_SUFFIX,
+    "3m": _TF_SCALP_SUFFIX,
+    "5m": _TF_SCALP_SUFFIX,
+    "15m": _TF_SCALP_SUFFIX,
+    "30m": _TF_INTRADAY_SUFFIX,
+    "1h": _TF_INTRADAY_SUFFIX,
+    "2h": _TF_INTRADAY_SUFFIX,
+    "4h": _TF_SWING_SUFFIX,
+    "12h": _TF_SWING_SUFFIX,
+    "1d": _TF_POSITION_SUFFIX,
+    "3d": _TF_POSITION_SUFFIX,
+    "1w": _TF_LONG_TERM_SUFFIX,
+    "1M": _TF_LONG_TERM_SUFFIX,
+})
+
+_ASSET_CONTEXT_MAP = MappingProxyType({
+    "btc": """
 **BITCOIN (BTC) ANALYSIS - CRITICAL CONTEXT:**
 - BTC is the market leader and often sets the trend for the entire crypto market
 - Focus on major institutional support/resistance levels (BTC has strong institutional accumulation zones)
@@ -83,7 +99,7 @@ def get_ta_prompt(
 - Use slightly wider stops than alts (1.5-2x) due to potential for larger moves
 - Watch for volume spikes at key levels - institutional accumulation/distribution
 """,
-            "sol": """
+    "sol": """
 **SOLANA (SOL) ANALYSIS - CRITICAL CONTEXT:**
 - Higher volatility than BTC/ETH - can move 10-20%+ in a single day
 - Strong correlation with DeFi and NFT ecosystem trends
@@ -96,7 +112,7 @@ def get_ta_prompt(
 - Use moderate stops (1-2% for swing, 0.5-1% for scalping)
 - Watch for correlation with meme coins (many are on Solana)
 """,
-            "eth": """
+    "eth": """
 **ETHEREUM (ETH) ANALYSIS - CRITICAL CONTEXT:**
 - Second-largest market cap, high liquidity, institutional interest
 - Influenced by DeFi trends, staking yields, and network upgrade narratives
@@ -109,7 +125,7 @@ def get_ta_prompt(
 - Use moderate stops (1-2% for swing, 0.5-1% for scalping)
 - Strong correlation with DeFi TVL and NFT market health
 """,
-            "alts": """
+    "alts": """
 **ALTCOIN ANALYSIS - CRITICAL CONTEXT:**
 - HIGHER VOLATILITY AND RISK than BTC/ETH - can move 20-50%+ in a single day
 - Strong correlation with BTC trends - alts often follow BTC direction
@@ -123,7 +139,7 @@ def get_ta_prompt(
 - Consider tokenomics (supply, vesting schedules, unlocks)
 - Watch for correlation with sector trends (DeFi, gaming, AI, etc.)
 """,
-            "memecoin": """
+    "memecoin": """
 **MEMECOIN ANALYSIS - CRITICAL CONTEXT:**
 - EXTREME VOLATILITY - HIGH RISK, HIGH REWARD
 - Can move 50-100%+ in hours or even minutes
@@ -140,14 +156,11 @@ def get_ta_prompt(
 - Consider market cap - micro-cap memes = extreme risk
 - Set alerts for rapid price movements
 """
-        }
-        asset_context = asset_context_map.get(asset_type.lower(), "")
-    
-    # Trade direction context
-    direction_context = ""
-    if trade_direction:
-        if trade_direction.lower() == "long":
-            direction_context = """
+})
+
+# Keyed by the lower-cased trade direction
+_DIRECTION_MAP = MappingProxyType({
+    "long": """
 **TRADE DIRECTION: LONG (BULLISH BIAS) - FOCUS YOUR ANALYSIS:**
 - Prioritize BUY/ENTRY opportunities and bullish setups
 - Identify support levels for optimal entry points
@@ -159,9 +172,8 @@ def get_ta_prompt(
 - Consider entry on pullbacks to support rather than chasing breakouts
 - Watch for volume confirmation on upward moves
 - If chart shows bearish signals, note the conflict but focus on potential bullish reversals
-"""
-        elif trade_direction.lower() == "short":
-            direction_context = """
+""",
+    "short": """
 **TRADE DIRECTION: SHORT (BEARISH BIAS) - FOCUS YOUR ANALYSIS:**
 - Prioritize SELL/SHORT opportunities and bearish setups
 - Identify resistance levels for optimal entry points
@@ -173,9 +185,8 @@ def get_ta_prompt(
 - Consider entry on bounces to resistance rather than chasing breakdowns
 - Watch for volume confirmation on downward moves
 - If chart shows bullish signals, note the conflict but focus on potential bearish reversals
-"""
-        elif trade_direction.lower() == "both":
-            direction_context = """
+""",
+    "both": """
 **TRADE DIRECTION: BOTH (LONG & SHORT) - ANALYZE BOTH DIRECTIONS:**
 - Analyze BOTH bullish and bearish opportunities equally
 - Identify support levels for LONG entries AND resistance levels for SHORT entries
@@ -184,10 +195,12 @@ def get_ta_prompt(
 - Show take-profit targets for both long and short setups
 - Assess which direction has stronger signals and higher probability
 - Consider market context - is this a trending or ranging market?
-"""
-    
-    # Build prompt with proper string formatting
-    prompt_text = f"""You are an elite technical analyst with 20+ years of experience analyzing trading charts across all timeframes and markets.{timeframe_context}{asset_context}{direction_context}
+""",
+})
+
+_PROMPT_HEADER = "You are an elite technical analyst with 20+ years of experience analyzing trading charts across all timeframes and markets."
+
+_PROMPT_BODY = """
 
 **CRITICAL: Analyze this trading chart screenshot with EXTREME precision and provide PROFESSIONAL-GRADE trading insights.**
 
@@ -265,7 +278,7 @@ def get_ta_prompt(
 Provide your analysis in the following JSON format:
 
 ```json
-{{
+{
   "bias": "bullish|bearish|neutral",
   "confidence": 1-10,
   "timeframe": "detected timeframe",
@@ -274,45 +287,45 @@ Provide your analysis in the following JSON format:
   "chart_min_price": "lowest price visible on chart axis",
   "chart_max_price": "highest price visible on chart axis",
   "support_levels": [
-    {{"price": "level", "strength": "strong|moderate|weak", "reason": "brief explanation"}}
+    {"price": "level", "strength": "strong|moderate|weak", "reason": "brief explanation"}
   ],
   "resistance_levels": [
-    {{"price": "level", "strength": "strong|moderate|weak", "reason": "brief explanation"}}
+    {"price": "level", "strength": "strong|moderate|weak", "reason": "brief explanation"}
   ],
   "patterns": [
-    {{"name": "pattern name", "type": "reversal|continuation", "reliability": "high|medium|low"}}
+    {"name": "pattern name", "type": "reversal|continuation", "reliability": "high|medium|low"}
   ],
-  "trend": {{
+  "trend": {
     "direction": "up|down|sideways",
     "strength": "strong|moderate|weak",
     "since": "approximate time/level"
-  }},
-  "entry": {{
+  },
+  "entry": {
     "price": "suggested entry price",
     "reasoning": "why this entry point"
-  }},
-  "stop_loss": {{
+  },
+  "stop_loss": {
     "price": "stop loss price",
     "risk_percent": "percentage risk",
     "reasoning": "why this SL level"
-  }},
+  },
   "take_profits": [
-    {{
+    {
       "price": "TP1 price",
       "risk_reward": "R:R ratio",
       "reasoning": "why this TP"
-    }},
-    {{
+    },
+    {
       "price": "TP2 price",
       "risk_reward": "R:R ratio",
       "reasoning": "why this TP"
-    }}
+    }
   ],
   "risk_reward_ratio": "overall R:R",
   "position_sizing": "suggestions",
   "risks": ["list of key risks"],
   "reasoning": "comprehensive explanation of the analysis and trade setup"
-}}
+}
 ```
 
 **CRITICAL Guidelines for MAXIMUM ACCURACY:**
@@ -374,9 +387,152 @@ After providing the JSON analysis, describe how you would annotate the chart ima
 - Red lines for stop-loss levels
 - Blue lines for take-profit levels
 - Yellow dashed lines for support/resistance
-- Text labels for key levels and patterns
+- Text labels for key levels and patterns"""
+
+_PROMPT_BODY_V2 = """
+
+**Analyze this trading chart screenshot and give precise, actionable trading insights.**
+
+**Accuracy rules (apply to every value you report):**
+- Base all conclusions on visible chart data only - never guess
+- Read every price EXACTLY from the chart's price axis/labels - no rounding or approximation
+- Preserve the chart's notation (e.g. "45.2K", "1.5M", "-1M") and use one format throughout
+- If a price, symbol or timeframe is not clearly visible, state "not visible" or "unknown"
+- Only report patterns that are clearly visible and fully formed
+- Lower confidence/reliability when the chart or setup is unclear
+
+**Your Analysis Should Include:**
+
+1. **Chart Identification:** asset/symbol, timeframe, chart type, current price (rightmost candle or current price indicator), and the bottom-most and top-most labels on the price axis (usually the right side) as "chart_min_price" and "chart_max_price"
+2. **Key Levels:** 2-3+ support and resistance levels where price bounced/rejected, swing highs/lows, visible psychological levels. Strength: "strong" = 3+ clear touches, "moderate" = 2-3 touches, "weak" = single or unclear touch
+3. **Patterns:** chart patterns (reversal or continuation), trend direction, candlestick patterns. Reliability: "high" (classic, well-formed), "medium" (partial), "low" (unclear)
+4. **Price Action:** structure (higher highs/lows or lower highs/lows), momentum, volatility, volume (if visible), gaps, support/resistance zones
+5. **Trading Recommendations:** a decisive bias; entry, stop-loss and 2-3 take-profit levels at chart prices, each with reasoning; stop distance appropriate for the timeframe; risk-reward of at least 1:2 (aim for 1:3+); confidence 1-10; entry timing ("immediate", "on pullback to [level]", "on breakout above/below [level]")
+6. **Risk Management:** position sizing (1-5% of portfolio for high confidence, 0.5-2% for lower; never risk more than 2% of capital on one trade), key risks, levels that invalidate the setup, alternative scenarios, trailing stop if applicable
+
+**Output Format:**
 
-Begin your analysis now. Read carefully, verify twice, be precise."""
+Provide your analysis in the following JSON format:
+
+```json
+{
+  "bias": "bullish|bearish|neutral",
+  "confidence": 1-10,
+  "timeframe": "detected timeframe",
+  "asset": "symbol if visible, else 'unknown'",
+  "current_price": "current price level",
+  "chart_min_price": "lowest price visible on chart axis",
+  "chart_max_price": "highest price visible on chart axis",
+  "support_levels": [
+    {"price": "level", "strength": "strong|moderate|weak", "reason": "brief explanation"}
+  ],
+  "resistance_levels": [
+    {"price": "level", "strength": "strong|moderate|weak", "reason": "brief explanation"}
+  ],
+  "patterns": [
+    {"name": "pattern name", "type": "reversal|continuation", "reliability": "high|medium|low"}
+  ],
+  "trend": {
+    "direction": "up|down|sideways",
+    "strength": "strong|moderate|weak",
+    "since": "approximate time/level"
+  },
+  "entry": {
+    "price": "suggested entry price",
+    "reasoning": "why this entry point"
+  },
+  "stop_loss": {
+    "price": "stop loss price",
+    "risk_percent": "percentage risk",
+    "reasoning": "why this SL level"
+  },
+  "take_profits": [
+    {
+      "price": "TP1 price",
+      "risk_reward": "R:R ratio",
+      "reasoning": "why this TP"
+    },
+    {
+      "price": "TP2 price",
+      "risk_reward": "R:R ratio",
+      "reasoning": "why this TP"
+    }
+  ],
+  "risk_reward_ratio": "overall R:R",
+  "position_sizing": "suggestions",
+  "risks": ["list of key risks"],
+  "reasoning": "comprehensive explanation of the analysis and trade setup"
+}
+```
+
+After providing the JSON analysis, describe how you would annotate the chart image with green arrows for entry points, red lines for stop-loss levels, blue lines for take-profit levels, yellow dashed lines for support/resistance, and text labels for key levels and patterns."""
+
+_PROMPT_CLOSING = "\n\nBegin your analysis now. Read carefully, verify twice, be precise."
+
+# Identical for every request of a prompt version. It leads the prompt so
+# Gemini's prefix cache can reuse it; only the context blocks after it vary.
+# "2" is the condensed body, kept selectable for A/B comparison.
+_STATIC_PREFIXES = MappingProxyType({
+    "1": _PROMPT_HEADER + _PROMPT_BODY,
+    "2": _PROMPT_HEADER + _PROMPT_BODY_V2,
+})
+
+PROMPT_VERSIONS = tuple(_STATIC_PREFIXES)
+
+
+def get_ta_prompt(
+    timeframe: Optional[str] = None,
+    asset_type: Optional[str] = None,
+    trade_direction: Optional[str] = None,
+    version: str = "1"
+) -> str:
+    """
+    Returns the main technical analysis prompt for chart analysis.
     
-    return prompt_text
+    Args:
+        timeframe: Optional timeframe to include in the prompt (1m, 5m, 15m, 1h, 4h, 1d, 1w, 1M)
+        asset_type: Optional asset type (btc, sol, eth, alts, memecoin)
+        trade_direction: Optional trade direction ('long' or 'short')
+        version: Prompt body version, one of PROMPT_VERSIONS
+    """
+    # Lower-case here so "BTC" and "btc" share a cache slot
+    return _build_ta_prompt(
+        timeframe,
+        asset_type.lower() if asset_type else None,
+        trade_direction.lower() if trade_direction else None,
+        version,
+    )
+
+
+@lru_cache(maxsize=512)
+def _build_ta_prompt(
+    timeframe: Optional[str],
+    asset_type: Optional[str],
+    trade_direction: Optional[str],
+    version: str
+) -> str:
+    """Assemble the prompt; asset_type and trade_direction must already be lower-case."""
+    return _STATIC_PREFIXES[version] + _build_dynamic_suffix(timeframe, asset_type, trade_direction)
 
+
+def _build_dynamic_suffix(
+    timeframe: Optional[str],
+    asset_type: Optional[str],
+    trade_direction: Optional[str]
+) -> str:
+    """Context blocks plus the closing line; arguments as for _build_ta_prompt."""
+    timeframe_context = ""
+    if timeframe and timeframe != "auto":
+        tf_desc = _TIMEFRAME_MAP.get(timeframe, timeframe)
+        timeframe_context = (
+            f"\n\n**IMPORTANT: This chart is a {tf_desc} timeframe.** Adjust your analysis accordingly:\n"
+            f"{_TIMEFRAME_SUFFIX.get(timeframe, '')}"
+        )
+    
+    # Asset-specific context
+    asset_context = _ASSET_CONTEXT_MAP.get(asset_type, "")
+    
+    # Trade direction context
+    direction_context = _DIRECTION_MAP.get(trade_direction, "")
+    
+    return "".join((timeframe_context, asset_context, direction_context, _PROMPT_CLOSING))
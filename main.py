@@ -1,24 +1,30 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 import google.generativeai as genai
 from google import genai as genai_new
 from PIL import Image
 import io
 import os
 from dotenv import load_dotenv
-import json
+import orjson
 import base64
 from typing import Optional
 import logging
 import traceback
 import asyncio
+import time
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
-import hashlib
+from contextlib import asynccontextmanager
+from blake3 import blake3
+import re
+import uuid
 from pathlib import Path
+import aiofiles
+import aiofiles.os
 
-from utils.prompts import get_fortnite_skin_prompt, get_skin_styles
+from utils.prompts import get_fortnite_skin_prompt, get_skin_styles_json, get_style
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,46 +32,148 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = FastAPI(title="Fortnite Skin Generator - Nano Banana", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the cache size limit in the background for the app's lifetime"""
+    prune_task = asyncio.create_task(prune_cache_periodically()) if CACHE_MAX_BYTES > 0 else None
+    yield
+    if prune_task is not None:
+        prune_task.cancel()
+
+app = FastAPI(
+    title="Fortnite Skin Generator - Nano Banana",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
-# Thread pool executor for blocking I/O operations
-executor = ThreadPoolExecutor(max_workers=50, thread_name_prefix="skin_generator")
+# Thread pool for CPU-bound PIL work (decode, resize, encode). Gemini calls
+# are awaited directly on the event loop, so they don't need threads.
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIL_WORKERS", os.cpu_count() or 4)),
+    thread_name_prefix="skin_generator",
+)
 
 # Cache directory for storing generated skins
 CACHE_DIR = Path(os.getenv("CACHE_DIR", "cache"))
 CACHE_DIR.mkdir(exist_ok=True, parents=True)
 
-def get_image_hash(image_bytes: bytes, style: str) -> str:
-    """Generate a hash of the image bytes and style for caching"""
-    combined = image_bytes + style.encode()
-    return hashlib.sha256(combined).hexdigest()
+# Least recently used entries are deleted once the cache grows past this
+# size (0 disables the limit); the check runs every CACHE_PRUNE_INTERVAL seconds
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(1024 ** 3)))
+CACHE_PRUNE_INTERVAL = float(os.getenv("CACHE_PRUNE_INTERVAL", "600"))
+# Temp files older than this (seconds) were left behind by an interrupted write
+TMP_FILE_GRACE = 300
+
+# Long edge (px) uploads are downscaled to before they are sent to Gemini
+MAX_IMAGE_EDGE = int(os.getenv("MAX_IMAGE_EDGE", "1024"))
+# Long edge (px) of the original-image preview returned to the browser
+PREVIEW_EDGE = int(os.getenv("PREVIEW_EDGE", "512"))
+
+# Uploads are read in chunks of this size and rejected once they pass MAX_UPLOAD_SIZE
+UPLOAD_CHUNK_SIZE = 256 * 1024
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
 
 def get_cache_path(image_hash: str) -> Path:
     """Get the cache file path for a given image hash"""
     return CACHE_DIR / f"{image_hash}.json"
 
-def load_from_cache(image_hash: str) -> Optional[dict]:
-    """Load generated skin from cache if it exists"""
+async def load_from_cache(image_hash: str) -> Optional[bytes]:
+    """Load a cached response body for a generated skin if it exists"""
     cache_path = get_cache_path(image_hash)
-    if cache_path.exists():
-        try:
-            with open(cache_path, 'r') as f:
-                cached_data = json.load(f)
-                logger.info(f"Cache hit for image hash: {image_hash[:16]}...")
-                return cached_data
-        except Exception as e:
-            logger.warning(f"Failed to load cache: {e}")
-    return None
-
-def save_to_cache(image_hash: str, result: dict):
-    """Save generated skin to cache"""
+    try:
+        async with aiofiles.open(cache_path, 'rb') as f:
+            payload = await f.read()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Failed to load cache: %s", e)
+        return None
+    # Mark the entry as recently used - pruning evicts by mtime, since
+    # atime isn't updated on most (relatime/noatime) mounts
+    try:
+        await asyncio.to_thread(os.utime, cache_path)
+    except OSError:
+        pass
+    logger.info("Cache hit for image hash: %.16s...", image_hash)
+    return payload
+
+async def save_to_cache(image_hash: str, payload: bytes):
+    """Save a serialized response body for a generated skin to cache"""
     try:
         cache_path = get_cache_path(image_hash)
-        with open(cache_path, 'w') as f:
-            json.dump(result, f, indent=2)
-        logger.info(f"Cached result for image hash: {image_hash[:16]}...")
+        # Write to a temp file and rename so readers never see a partial file
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex}.tmp")
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(payload)
+        await aiofiles.os.replace(tmp_path, cache_path)
+        logger.info("Cached result for image hash: %.16s...", image_hash)
     except Exception as e:
-        logger.warning(f"Failed to save cache: {e}")
+        logger.warning("Failed to save cache: %s", e)
+
+def prune_cache(max_bytes: int) -> int:
+    """
+    Delete the least recently used cache entries until the cache fits in
+    max_bytes. Temp files left by interrupted writes are removed once they are
+    older than TMP_FILE_GRACE. Returns how many entries were removed.
+    """
+    now = time.time()
+    entries = []
+    total = 0
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+            elif entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                if now - stat.st_mtime > TMP_FILE_GRACE:
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+                else:
+                    total += stat.st_size  # Write in progress, still takes up space
+    if total <= max_bytes:
+        return 0
+    
+    removed = 0
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # Another worker pruned it first
+        total -= size
+        removed += 1
+    return removed
+
+async def prune_cache_periodically():
+    """Keep the cache under CACHE_MAX_BYTES, scanning it in the PIL executor"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            removed = await loop.run_in_executor(executor, prune_cache, CACHE_MAX_BYTES)
+            if removed:
+                logger.info("Pruned %d cache entries", removed)
+        except Exception as e:
+            logger.warning("Failed to prune cache: %s", e)
+        await asyncio.sleep(CACHE_PRUNE_INTERVAL)
+
+# Cache key -> task of the generation currently running for it
+_inflight: "dict[str, asyncio.Task]" = {}
+
+def _finish_flight(cache_key: str, task: asyncio.Task):
+    """Drop a finished generation from _inflight and mark its exception retrieved"""
+    if _inflight.get(cache_key) is task:
+        del _inflight[cache_key]
+    if not task.cancelled():
+        task.exception()  # Requests awaiting it re-raise the exception themselves
 
 # CORS middleware - Production domains
 allow_origins_list = [
@@ -98,12 +206,15 @@ genai.configure(api_key=api_key)
 IMAGE_MODEL = os.getenv("IMAGE_MODEL", "gemini-2.0-flash-exp")
 VISION_MODEL = os.getenv("VISION_MODEL", "gemini-2.0-flash-exp")
 
+# Created once and shared by all requests - the model object holds no per-request state
+vision_model = genai.GenerativeModel(VISION_MODEL)
+
 # Initialize the new Genai client for image generation
 try:
     client = genai_new.Client(api_key=api_key)
-    logger.info(f"Initialized Nano Banana client with models: IMAGE={IMAGE_MODEL}, VISION={VISION_MODEL}")
+    logger.info("Initialized Nano Banana client with models: IMAGE=%s, VISION=%s", IMAGE_MODEL, VISION_MODEL)
 except Exception as e:
-    logger.warning(f"Could not initialize new genai client: {e}. Falling back to standard API.")
+    logger.warning("Could not initialize new genai client: %s. Falling back to standard API.", e)
     client = None
 
 
@@ -137,15 +248,13 @@ async def health():
 @app.get("/styles")
 async def get_styles():
     """Get available Fortnite skin styles"""
-    return {
-        "styles": get_skin_styles()
-    }
+    return Response(content=get_skin_styles_json(), media_type="application/json")
 
 
 @app.options("/generate")
 async def generate_options():
     """Handle CORS preflight requests"""
-    return JSONResponse(
+    return ORJSONResponse(
         content={},
         headers={
             "Access-Control-Allow-Origin": "*",
@@ -155,122 +264,109 @@ async def generate_options():
     )
 
 
-@app.post("/generate")
-async def generate_fortnite_skin(
-    file: UploadFile = File(...),
-    style: str = Form(default="legendary"),
-    custom_prompt: str = Form(default="")
-):
+def process_image(image_bytes_data: bytes, req_id: str):
     """
-    Transform an uploaded image into a Fortnite-style character skin.
-    
-    Uses Google's Nano Banana (Gemini Image Generation) to create 
-    stylized Fortnite character skins from any input image.
-    
-    Args:
-        file: Source image file (person, character, object, etc.)
-        style: Skin style (legendary, epic, rare, uncommon, collab, meme, anime, cyberpunk)
-        custom_prompt: Optional custom instructions for the transformation
+    Decode an upload, flatten it to RGB and downscale it. Returns the image and
+    its JPEG encoding. Runs in the PIL executor - Pillow releases the GIL while
+    decoding, resizing and encoding, so these calls run in parallel on threads.
     """
-    request_id = f"{file.filename}_{id(file)}"
-    logger.info(f"[{request_id}] Received generation request: {file.filename}, style: {style}")
-    
     try:
-        # Read image bytes
-        image_bytes = await file.read()
-        
-        # Generate cache key
-        cache_key = get_image_hash(image_bytes, style + custom_prompt)
+        img = Image.open(io.BytesIO(image_bytes_data))
+        logger.info("[%s] Image opened: %s, mode: %s", req_id, img.size, img.mode)
         
-        # Check cache
-        cached_result = load_from_cache(cache_key)
-        if cached_result:
-            logger.info(f"[{request_id}] Returning cached result")
-            return JSONResponse(content=cached_result)
+        # JPEGs (most photo uploads) can be decoded straight to RGB at a reduced
+        # scale that still covers MAX_IMAGE_EDGE; a no-op for other formats
+        img.draft("RGB", (MAX_IMAGE_EDGE, MAX_IMAGE_EDGE))
         
-        logger.info(f"[{request_id}] Image size: {len(image_bytes)} bytes")
+        # Convert to RGB if necessary - already RGB is the common case
+        if img.mode != 'RGB':
+            if img.mode == 'RGBA':
+                # Flatten onto white, using only the alpha band as the mask
+                # (split() would copy all four bands, twice)
+                rgb_image = Image.new('RGB', img.size, (255, 255, 255))
+                rgb_image.paste(img, mask=img.getchannel('A'))
+                img = rgb_image
+            else:
+                img = img.convert("RGB")
         
-        if len(image_bytes) == 0:
-            raise HTTPException(status_code=400, detail="Empty file uploaded")
+        # Downscale oversized uploads - Gemini bills vision tokens by image
+        # size, and the model doesn't need more detail to restyle a subject
+        width, height = img.size
+        scale = MAX_IMAGE_EDGE / max(width, height)
+        if scale < 1.0:
+            new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
         
-        # Validate file size (max 10MB)
-        max_size = 10 * 1024 * 1024
-        if len(image_bytes) > max_size:
-            raise HTTPException(status_code=400, detail=f"File too large. Max size: 10MB")
+        # Encode once here, off the event loop - every Gemini call
+        # sends these bytes as-is instead of the SDK re-encoding the image
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        return img, buffer.getvalue()
+    except Exception as e:
+        logger.error("[%s] Failed to open image: %s", req_id, e)
+        raise ValueError(f"Invalid image file: {str(e)}")
+
+
+def convert_to_base64(img: Image.Image, req_id: str) -> str:
+    """
+    Base64 JPEG preview of the original image - the browser only shows it as a
+    preview, so send a small copy rather than the full upload
+    """
+    preview = img.copy()
+    preview.thumbnail((PREVIEW_EDGE, PREVIEW_EDGE), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    # The image is already RGB (process_image), so there is no alpha to lose
+    preview.save(buffer, format="JPEG", quality=85, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+async def _run_generation(
+    image_bytes: bytes,
+    style: str,
+    custom_prompt: str,
+    cache_key: str,
+    request_id: str
+) -> bytes:
+    """
+    Run the uncached generation pipeline (decode, Gemini, preview) for one upload.
+    Returns the serialized response body, which is also written to the cache.
+    """
+    logger.info("[%s] Image size: %d bytes", request_id, len(image_bytes))
+    
+    if len(image_bytes) == 0:
+        raise HTTPException(status_code=400, detail="Empty file uploaded")
+    
+    # Run image processing
+    try:
+        image, image_jpeg = await asyncio.get_event_loop().run_in_executor(
+            executor, process_image, image_bytes, request_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Get the transformation prompt
+    prompt = get_fortnite_skin_prompt(style, custom_prompt)
+    logger.info("[%s] Using style: %s", request_id, style)
+    
+    # Generate Fortnite skin using Nano Banana
+    async def generate_skin(prompt_text, jpeg_bytes, req_id):
+        """Generate Fortnite skin using Gemini's image capabilities"""
+        logger.info("[%s] Generating Fortnite skin with Nano Banana...", req_id)
         
-        # Process image
-        def process_image(image_bytes_data, req_id):
-            """Process image synchronously"""
-            try:
-                img = Image.open(io.BytesIO(image_bytes_data))
-                logger.info(f"[{req_id}] Image opened: {img.size}, mode: {img.mode}")
-                
-                # Convert to RGB if necessary
-                if img.mode == 'RGBA':
-                    rgb_image = Image.new('RGB', img.size, (255, 255, 255))
-                    if len(img.split()) == 4:
-                        rgb_image.paste(img, mask=img.split()[3])
-                    else:
-                        rgb_image.paste(img)
-                    img = rgb_image
-                elif img.mode != 'RGB':
-                    img = img.convert("RGB")
-                
-                return img
-            except Exception as e:
-                logger.error(f"[{req_id}] Failed to open image: {str(e)}")
-                raise ValueError(f"Invalid image file: {str(e)}")
+        generated_images = []
+        description = None
+        image_blob = {"mime_type": "image/jpeg", "data": jpeg_bytes}
         
-        # Run image processing
         try:
-            image = await asyncio.get_event_loop().run_in_executor(
-                executor, process_image, image_bytes, request_id
-            )
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-        
-        # Get the transformation prompt
-        prompt = get_fortnite_skin_prompt(style, custom_prompt)
-        logger.info(f"[{request_id}] Using style: {style}")
-        
-        # Generate Fortnite skin using Nano Banana
-        def generate_skin(prompt_text, img, req_id):
-            """Generate Fortnite skin using Gemini's image capabilities"""
-            logger.info(f"[{req_id}] Generating Fortnite skin with Nano Banana...")
-            
-            generated_images = []
-            description = None
-            
-            try:
-                if client:
-                    # Use new Genai client for image generation (Nano Banana)
-                    logger.info(f"[{req_id}] Using new Genai client with model: {IMAGE_MODEL}")
-                    
-                    # First, analyze the input image to understand what to transform
-                    analysis_prompt = f"""Analyze this image and describe the main subject in detail.
-                    I want to transform this into a Fortnite character skin.
-                    Describe: the pose, colors, clothing/features, and any distinctive elements.
-                    Be specific so we can recreate this as a Fortnite character."""
-                    
-                    # Convert PIL image to bytes for the API
-                    img_buffer = io.BytesIO()
-                    img.save(img_buffer, format="PNG")
-                    img_bytes = img_buffer.getvalue()
-                    
-                    # Analyze the image first
-                    vision_model = genai.GenerativeModel(VISION_MODEL)
-                    analysis_response = vision_model.generate_content([
-                        analysis_prompt,
-                        img
-                    ])
-                    
-                    image_description = analysis_response.text if hasattr(analysis_response, 'text') else "a character"
-                    logger.info(f"[{req_id}] Image analysis: {image_description[:200]}...")
-                    
-                    # Now generate the Fortnite skin
-                    full_prompt = f"""{prompt_text}
+            if client:
+                # Use new Genai client for image generation (Nano Banana)
+                logger.info("[%s] Using new Genai client with model: %s", req_id, IMAGE_MODEL)
+                
+                # Generate the Fortnite skin straight from the source image - the
+                # image model sees the subject itself, so no separate describe call
+                full_prompt = f"""{prompt_text}
 
-Based on this source image description: {image_description}
+Base the character on the attached source image: keep its pose, colors, clothing/features and any distinctive elements.
 
 CRITICAL VISUAL REQUIREMENTS:
 1. FULL BODY character from HEAD TO TOE (not cropped)
@@ -282,34 +378,40 @@ CRITICAL VISUAL REQUIREMENTS:
 The platform should be a glowing circle on the ground that the character stands on - just like the Fortnite Item Shop!
 
 Transform this into an authentic Fortnite skin that captures the essence of the source!"""
+                
+                # Try to generate image using the Gemini 2.0 model
+                try:
+                    response = await client.aio.models.generate_content(
+                        model=IMAGE_MODEL,
+                        contents=[
+                            full_prompt,
+                            genai_new.types.Part.from_bytes(data=jpeg_bytes, mime_type="image/jpeg"),
+                        ],
+                        config=genai_new.types.GenerateContentConfig(
+                            response_modalities=['TEXT', 'IMAGE']
+                        )
+                    )
                     
-                    # Try to generate image using the Gemini 2.0 model
-                    try:
-                        response = client.models.generate_content(
-                            model=IMAGE_MODEL,
-                            contents=full_prompt,
-                            config=genai_new.types.GenerateContentConfig(
-                                response_modalities=['TEXT', 'IMAGE']
+                    # Extract generated images and text from response
+                    for part in response.candidates[0].content.parts:
+                        if hasattr(part, 'inline_data') and part.inline_data:
+                            # This is an image
+                            img_data = part.inline_data.data
+                            mime_type = part.inline_data.mime_type or "image/png"
+                            generated_images.append(
+                                f"data:{mime_type};base64,{base64.b64encode(img_data).decode('utf-8')}"
                             )
-                        )
-                        
-                        # Extract generated images and text from response
-                        for part in response.candidates[0].content.parts:
-                            if hasattr(part, 'inline_data') and part.inline_data:
-                                # This is an image
-                                img_data = part.inline_data.data
-                                generated_images.append(base64.b64encode(img_data).decode('utf-8'))
-                                logger.info(f"[{req_id}] Generated image extracted!")
-                            elif hasattr(part, 'text') and part.text:
-                                description = part.text
-                                
-                    except Exception as gen_error:
-                        logger.warning(f"[{req_id}] Image generation failed: {gen_error}. Falling back to description-only mode.")
-                        
-                        # Fallback: Generate detailed description of the Fortnite skin
-                        fallback_prompt = f"""{prompt_text}
-
-Based on this source image: {image_description}
+                            logger.info("[%s] Generated image extracted!", req_id)
+                        elif hasattr(part, 'text') and part.text:
+                            description = part.text
+                            
+                except Exception as gen_error:
+                    logger.warning("[%s] Image generation failed: %s. Falling back to description-only mode.", req_id, gen_error)
+                    
+                    # Fallback: Generate detailed description of the Fortnite skin
+                    fallback_prompt = f"""{prompt_text}
+
+Use the attached source image as the subject.
 
 Since you cannot generate images directly, provide an extremely detailed description of what this 
 Fortnite skin would look like. Include:
@@ -323,61 +425,125 @@ Fortnite skin would look like. Include:
 8. Built-in emote idea
 
 Make it sound like official Fortnite patch notes!"""
-                        
-                        fallback_response = vision_model.generate_content([fallback_prompt, img])
-                        description = fallback_response.text if hasattr(fallback_response, 'text') else "Fortnite skin generated"
-                
-                else:
-                    # Fallback to old API
-                    logger.info(f"[{req_id}] Using legacy Genai API")
-                    model = genai.GenerativeModel(VISION_MODEL)
-                    response = model.generate_content([prompt_text, img])
-                    description = response.text if hasattr(response, 'text') else "Fortnite skin concept"
                     
-            except Exception as e:
-                logger.error(f"[{req_id}] Generation error: {str(e)}\n{traceback.format_exc()}")
-                raise
+                    fallback_response = await vision_model.generate_content_async([fallback_prompt, image_blob])
+                    description = fallback_response.text if hasattr(fallback_response, 'text') else "Fortnite skin generated"
             
-            return {
-                "generated_images": generated_images,
-                "description": description
-            }
-        
-        # Run generation
-        try:
-            result = await asyncio.get_event_loop().run_in_executor(
-                executor, generate_skin, prompt, image, request_id
-            )
+            else:
+                # Fallback to old API
+                logger.info("[%s] Using legacy Genai API", req_id)
+                response = await vision_model.generate_content_async([prompt_text, image_blob])
+                description = response.text if hasattr(response, 'text') else "Fortnite skin concept"
+                
         except Exception as e:
-            logger.error(f"[{request_id}] Generation failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Skin generation failed: {str(e)}")
-            
-        # Convert original image to base64
-        def convert_to_base64(img, req_id):
-            buffer = io.BytesIO()
-            img.save(buffer, format="PNG")
-            return base64.b64encode(buffer.getvalue()).decode("utf-8")
-            
-        original_base64 = await asyncio.get_event_loop().run_in_executor(
-            executor, convert_to_base64, image, request_id
-        )
+            logger.error("[%s] Generation error: %s\n%s", req_id, e, traceback.format_exc())
+            raise
         
-        # Build response
-        response_data = {
-            "success": True,
-            "style": style,
-            "original_image": f"data:image/png;base64,{original_base64}",
-            "generated_images": [f"data:image/png;base64,{img}" for img in result.get("generated_images", [])],
-            "description": result.get("description", ""),
-            "skin_details": extract_skin_details(result.get("description", ""))
+        return {
+            "generated_images": generated_images,
+            "description": description
         }
+    
+    # Run generation
+    try:
+        result = await generate_skin(prompt, image_jpeg, request_id)
+    except Exception as e:
+        logger.error("[%s] Generation failed: %s", request_id, e)
+        raise HTTPException(status_code=500, detail=f"Skin generation failed: {str(e)}")
+        
+    # Convert original image to base64
+    original_base64 = await asyncio.get_event_loop().run_in_executor(
+        executor, convert_to_base64, image, request_id
+    )
+    
+    # Build response
+    response_data = {
+        "success": True,
+        "style": style,
+        "original_image": f"data:image/jpeg;base64,{original_base64}",
+        "generated_images": result.get("generated_images", []),
+        "description": result.get("description", ""),
+        "skin_details": extract_skin_details(result.get("description", ""))
+    }
+    
+    # Serialize once - the same bytes are the response body and the cache entry
+    payload = orjson.dumps(response_data)
+    
+    # Write the cache entry before the generation leaves _inflight, so an
+    # identical request always finds one or the other. The write is a few ms
+    # against a 30-60s generation, and this task is already detached from the
+    # client, so a disconnect doesn't interrupt it
+    await save_to_cache(cache_key, payload)
+    
+    logger.info("[%s] Generation complete!", request_id)
+    return payload
+
+
+@app.post("/generate")
+async def generate_fortnite_skin(
+    file: UploadFile = File(...),
+    style: str = Form(default="legendary"),
+    custom_prompt: str = Form(default="")
+):
+    """
+    Transform an uploaded image into a Fortnite-style character skin.
+    
+    Uses Google's Nano Banana (Gemini Image Generation) to create 
+    stylized Fortnite character skins from any input image.
+    
+    Args:
+        file: Source image file (person, character, object, etc.)
+        style: Skin style (legendary, anime, meme, cyberpunk, horror; others fall back to legendary)
+        custom_prompt: Optional custom instructions for the transformation
+    """
+    request_id = f"{file.filename}_{id(file)}"
+    logger.info("[%s] Received generation request: %s, style: %s", request_id, file.filename, style)
+    
+    # Unknown styles get the legendary prompt; normalize up front so the
+    # cache key and response name the style that is actually generated
+    style = style.lower()
+    if get_style(style) is None:
+        style = "legendary"
+    
+    try:
+        # Stream the upload into a bounded buffer, hashing as chunks arrive
+        # so oversized files are rejected before they are fully buffered
+        hasher = blake3()
+        buffer = bytearray()
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            if len(buffer) + len(chunk) > MAX_UPLOAD_SIZE:
+                raise HTTPException(status_code=400, detail="File too large. Max size: 10MB")
+            hasher.update(chunk)
+            buffer.extend(chunk)
+        image_bytes = bytes(buffer)
+        
+        # Cache key covers the image and the generation options
+        hasher.update((style + custom_prompt).encode())
+        cache_key = hasher.hexdigest()
+        
+        # Check cache
+        cached_result = await load_from_cache(cache_key)
+        if cached_result:
+            logger.info("[%s] Returning cached result", request_id)
+            return Response(content=cached_result, media_type="application/json")
         
-        # Cache the result
-        save_to_cache(cache_key, response_data)
+        # Identical requests already being generated share a single Gemini call.
+        # It runs in its own task, so a cancelled request (client disconnect,
+        # shutdown) never cancels it for the requests sharing it
+        flight = _inflight.get(cache_key)
+        if flight is not None:
+            logger.info("[%s] Joining in-flight generation", request_id)
+        else:
+            flight = asyncio.create_task(
+                _run_generation(image_bytes, style, custom_prompt, cache_key, request_id)
+            )
+            _inflight[cache_key] = flight
+            flight.add_done_callback(partial(_finish_flight, cache_key))
+        payload = await asyncio.shield(flight)
         
-        logger.info(f"[{request_id}] Generation complete!")
-        return JSONResponse(
-            content=response_data,
+        return Response(
+            content=payload,
+            media_type="application/json",
             headers={
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Methods": "POST, OPTIONS",
@@ -388,14 +554,22 @@ Make it sound like official Fortnite patch notes!"""
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}\n{traceback.format_exc()}")
+        logger.error("Unexpected error: %s\n%s", e, traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+# Patterns for pulling a skin name out of the generated description
+_SKIN_NAME_PATTERNS = [
+    re.compile(r'(?:skin name|called|named|introducing)[:\s]+["\']?([^"\'\n,]+)["\']?', re.IGNORECASE),
+    re.compile(r'["\']([^"\']+)["\'](?:\s+skin|\s+outfit)', re.IGNORECASE),
+]
+
+# Checked in list order (not position in the text) - the first match wins
+_RARITIES = ("legendary", "epic", "rare", "uncommon", "common", "mythic", "icon series", "marvel series", "dc series", "gaming legends", "star wars series")
+
+
 def extract_skin_details(description: str) -> dict:
     """Extract structured skin details from the description"""
-    import re
-    
     details = {
         "name": None,
         "rarity": None,
@@ -411,20 +585,16 @@ def extract_skin_details(description: str) -> dict:
         return details
     
     # Try to extract skin name
-    name_patterns = [
-        r'(?:skin name|called|named|introducing)[:\s]+["\']?([^"\'\n,]+)["\']?',
-        r'["\']([^"\']+)["\'](?:\s+skin|\s+outfit)',
-    ]
-    for pattern in name_patterns:
-        match = re.search(pattern, description, re.IGNORECASE)
+    for pattern in _SKIN_NAME_PATTERNS:
+        match = pattern.search(description)
         if match:
             details["name"] = match.group(1).strip()
             break
     
     # Try to extract rarity
-    rarities = ["legendary", "epic", "rare", "uncommon", "common", "mythic", "icon series", "marvel series", "dc series", "gaming legends", "star wars series"]
-    for rarity in rarities:
-        if rarity.lower() in description.lower():
+    description_lower = description.lower()
+    for rarity in _RARITIES:
+        if rarity in description_lower:
             details["rarity"] = rarity.title()
             break
     
@@ -1,34 +1,100 @@
 """
 Production-ready server startup script with proper concurrency settings.
-Run with: python start_server.py
-Or use uvicorn directly: uvicorn main:app --host 0.0.0.0 --port 8000 --workers 4 --limit-concurrency 50
+Run with: python start_server.py (gunicorn + UvicornWorker)
+     or: python start_server.py --dev (plain uvicorn, also used on Windows)
+Or use uvicorn directly: uvicorn main:app --host 0.0.0.0 --port 8000 --workers 4 --limit-concurrency 200
+
+Each request is ~30-60s of waiting on Gemini with almost no CPU, so the shape is
+one worker per core with a high per-worker concurrency limit.
 """
 
 import uvicorn
+import logging
 import os
+import shutil
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+try:
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # gunicorn is not installed (e.g. on Windows)
+    UvicornWorker = None
+
+if UvicornWorker is not None:
+    class Worker(UvicornWorker):
+        """UvicornWorker with the same protocol and concurrency settings as the --dev path"""
+        CONFIG_KWARGS = {
+            "loop": "auto",
+            "http": "httptools",
+            "ws": "none",
+            "limit_concurrency": int(os.getenv("LIMIT_CONCURRENCY", 200)),
+        }
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     # Get configuration from environment or use defaults
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
-    workers = int(os.getenv("WORKERS", 4))  # Number of worker processes
-    limit_concurrency = int(os.getenv("LIMIT_CONCURRENCY", 50))  # Max concurrent requests per worker
+    workers = int(os.getenv("WORKERS", os.cpu_count() or 2))  # One worker process per core
+    limit_concurrency = int(os.getenv("LIMIT_CONCURRENCY", 200))  # Max concurrent requests per worker
+    backlog = int(os.getenv("BACKLOG", 4096))  # Keep below the somaxconn / ulimit -n of the host
+    timeout_keep_alive = int(os.getenv("KEEP_ALIVE", 5))  # Requests take 30-60s, idle sockets are rarely reused
+    limit_max_requests = int(os.getenv("MAX_REQUESTS", 1000)) or None  # Recycle workers to cap memory growth, 0 disables
+    access_log = os.getenv("ACCESS_LOG", "false").lower() in ("1", "true", "yes")  # Per-request formatting cost, off by default
+    
+    # uvloop (libuv event loop) and httptools (C HTTP parser) ship with
+    # uvicorn[standard]; uvloop is not available on Windows
+    loop = "asyncio" if sys.platform == "win32" else "uvloop"
+    
+    # gunicorn supervises the workers (graceful SIGHUP reload, jittered
+    # max-requests recycling); it does not run on Windows
+    use_gunicorn = "--dev" not in sys.argv and UvicornWorker is not None and shutil.which("gunicorn")
+    
+    logger.info("Starting server with %d workers (cpu_count=%s), max %d concurrent requests per worker",
+                workers, os.cpu_count(), limit_concurrency)
+    logger.info("Total capacity: %d workers x %d = ~%d concurrent requests",
+                workers, limit_concurrency, workers * limit_concurrency)
+    if use_gunicorn and limit_max_requests:
+        logger.info("Workers recycle after %d requests", limit_max_requests)
     
-    print(f"Starting server with {workers} workers, max {limit_concurrency} concurrent requests per worker")
-    print(f"Total capacity: ~{workers * limit_concurrency} concurrent requests")
+    if use_gunicorn:
+        # gunicorn's --keep-alive and --max-requests map to the uvicorn settings
+        args = [
+            "gunicorn", "main:app",
+            "-w", str(workers),
+            "-k", "start_server.Worker",
+            "-b", f"{host}:{port}",
+            "--backlog", str(backlog),
+            "--keep-alive", str(timeout_keep_alive),
+            "--timeout", "120",
+            "--log-level", "info",
+        ]
+        if access_log:
+            args += ["--access-logfile", "-"]
+        if limit_max_requests:
+            args += ["--max-requests", str(limit_max_requests), "--max-requests-jitter", "50"]
+        os.execvp("gunicorn", args)
     
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         workers=workers,  # Multiple worker processes for better CPU utilization
+        loop=loop,
+        http="httptools",
+        ws="none",  # No websocket routes
+        lifespan="on",
         limit_concurrency=limit_concurrency,  # Max concurrent connections per worker
-        backlog=2048,  # Connection backlog
-        timeout_keep_alive=30,  # Keep connections alive for 30 seconds
+        # No limit_max_requests here: with a single worker (or the supervisor
+        # of older uvicorn releases) a recycled worker is never respawned
+        backlog=backlog,  # Connection backlog
+        timeout_keep_alive=timeout_keep_alive,
         log_level="info",
-        access_log=True,
+        access_log=access_log,
     )
 
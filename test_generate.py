@@ -1,44 +1,125 @@
-import requests
+"""
+Smoke / load test for the /generate endpoint.
+
+Usage: python test_generate.py [requests] [concurrency] [--cached]
+With no arguments a single request is sent and its result printed.
+
+Identical uploads share one generation (in-flight coalescing, then the disk
+cache), so by default each load-test request carries a unique custom_prompt
+to force a real Gemini generation. --cached sends identical requests instead,
+measuring only the coalesced/cached path.
+
+Needs aiohttp, which the server does not depend on: pip install aiohttp
+"""
+
+import asyncio
 import sys
+import time
+from pathlib import Path
+
+import aiohttp
+
+URL = 'http://localhost:8000/generate'
+IMAGE = Path(__file__).parent / 'image (3).jpg'
+STYLE = 'anime'
+TIMEOUT = aiohttp.ClientTimeout(total=120)
+
+
+def print_result(result):
+    print(f"Success: {result.get('success')}")
+    print(f"Style: {result.get('style')}")
+    print(f"Generated Images: {len(result.get('generated_images', []))} images")
+    print(f"Description Length: {len(result.get('description', ''))} characters")
+
+    skin_details = result.get('skin_details', {})
+    print(f"Skin Name: {skin_details.get('name', 'N/A')}")
+    print(f"Rarity: {skin_details.get('rarity', 'N/A')}")
+
+    print()
+    print("First 500 chars of description:")
+    print("-" * 40)
+    print(result.get('description', '')[:500])
+
 
-print("Testing Fortnite Skin Generator API...")
-print("=" * 50)
+async def post_image(session, image_bytes, custom_prompt=''):
+    # FormData can only be sent once, but the image bytes are shared
+    data = aiohttp.FormData()
+    data.add_field('file', image_bytes, filename=IMAGE.name, content_type='image/jpeg')
+    data.add_field('style', STYLE)
+    if custom_prompt:
+        data.add_field('custom_prompt', custom_prompt)
 
-try:
-    files = {'file': open('image (3).jpg', 'rb')}
-    data = {'style': 'anime'}
-    
+    start = time.perf_counter()
+    async with session.post(URL, data=data) as r:
+        body = await r.json() if r.status == 200 else await r.text()
+    return r.status, body, time.perf_counter() - start
+
+
+async def main(total, concurrency, cached):
+    image_bytes = IMAGE.read_bytes()
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    results = []
+    errors = []
+
+    async def worker(i):
+        # A unique prompt gives each request its own cache key
+        custom_prompt = '' if cached or total == 1 else f"Load test request {i}"
+        async with semaphore:
+            try:
+                results.append(await post_image(session, image_bytes, custom_prompt))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                errors.append(e)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=TIMEOUT) as session:
+        await asyncio.gather(*[worker(i) for i in range(total)])
+
+    if total == 1:
+        if errors:
+            print(f"Error: {errors[0]!r}")
+            return False
+        status, body, _ = results[0]
+        print(f"Status Code: {status}")
+        if status != 200:
+            print(f"Error: {body[:500]}")
+            return False
+        print_result(body)
+        return True
+
+    # Latencies cover every request that got a response, including non-200s
+    latencies = sorted(elapsed for _, _, elapsed in results)
+    failed = [status for status, _, _ in results if status != 200]
+    mode = "cached/coalesced path only" if cached else "uncached generations"
+    print(f"Requests: {total}  Concurrency: {concurrency}  Mode: {mode}")
+    print(f"Failed: {len(failed)}  Errors: {len(errors)}")
+    if errors:
+        print(f"First error: {errors[0]!r}")
+    if latencies:
+        print(f"p50: {latencies[len(latencies) // 2]:.2f}s")
+        print(f"p95: {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.2f}s")
+    return not failed and not errors
+
+
+if __name__ == '__main__':
+    cached = '--cached' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--cached']
+    total = int(args[0]) if args else 1
+    concurrency = int(args[1]) if len(args) > 1 else min(total, 50)
+
+    print("Testing Fortnite Skin Generator API...")
+    print("=" * 50)
     print("Uploading image and generating skin...")
-    print("Style: anime")
+    print(f"Style: {STYLE}")
     print("This may take 30-60 seconds...")
     print()
-    
-    r = requests.post('http://localhost:8000/generate', files=files, data=data, timeout=120)
-    
-    print(f"Status Code: {r.status_code}")
-    
-    if r.status_code == 200:
-        result = r.json()
-        print(f"Success: {result.get('success')}")
-        print(f"Style: {result.get('style')}")
-        print(f"Generated Images: {len(result.get('generated_images', []))} images")
-        print(f"Description Length: {len(result.get('description', ''))} characters")
-        
-        skin_details = result.get('skin_details', {})
-        print(f"Skin Name: {skin_details.get('name', 'N/A')}")
-        print(f"Rarity: {skin_details.get('rarity', 'N/A')}")
-        
-        print()
-        print("First 500 chars of description:")
-        print("-" * 40)
-        print(result.get('description', '')[:500])
-        print()
-        print("API TEST PASSED!")
-    else:
-        print(f"Error: {r.text[:500]}")
+
+    try:
+        ok = asyncio.run(main(total, concurrency, cached))
+    except Exception as e:
+        print(f"Error: {e}")
         sys.exit(1)
-        
-except Exception as e:
-    print(f"Error: {e}")
-    sys.exit(1)
 
+    if not ok:
+        sys.exit(1)
+    print()
+    print("API TEST PASSED!")
@@ -1,57 +1,30 @@
 """
 Fortnite Skin Generator prompts for Nano Banana (Gemini Image Generation).
 """
-from typing import Optional
-
-def get_skin_styles() -> list:
-    """Returns all available Fortnite skin styles - 5 distinct options"""
-    return [
-        {
-            "id": "legendary",
-            "name": "Legendary",
-            "description": "Premium glowing armor with gold/chrome effects",
-            "color": "#f5a623",
-            "icon": "⭐"
-        },
-        {
-            "id": "anime",
-            "name": "Anime",
-            "description": "Cel-shaded anime/manga character style",
-            "color": "#ff6b9d",
-            "icon": "🌸"
-        },
-        {
-            "id": "meme",
-            "name": "Meme Lord",
-            "description": "Funny, goofy, viral-worthy character",
-            "color": "#f39c12",
-            "icon": "😂"
-        },
-        {
-            "id": "cyberpunk",
-            "name": "Cyberpunk",
-            "description": "Neon-lit futuristic cyber warrior",
-            "color": "#00ffff",
-            "icon": "🤖"
-        },
-        {
-            "id": "horror",
-            "name": "Horror",
-            "description": "Creepy, spooky Fortnitemares style",
-            "color": "#8b0000",
-            "icon": "👻"
-        }
-    ]
-
-
-def get_fortnite_skin_prompt(style: str = "legendary", custom_prompt: str = "") -> str:
-    """
-    Returns the prompt for generating a Fortnite skin based on style.
-    Each style has a VERY DISTINCT visual direction.
-    """
-    
-    style_prompts = {
-        "legendary": """CREATE A LEGENDARY FORTNITE SKIN:
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+import orjson
+
+class SkinStyle(NamedTuple):
+    """A selectable skin style - the catalog fields shown in the UI plus its prompt"""
+    id: str
+    name: str
+    description: str
+    color: str
+    icon: str
+    prompt: str
+
+
+# Single source for both the /styles catalog and the generation prompts
+STYLES = (
+    SkinStyle(
+        id="legendary",
+        name="Legendary",
+        description="Premium glowing armor with gold/chrome effects",
+        color="#f5a623",
+        icon="⭐",
+        prompt="""CREATE A LEGENDARY FORTNITE SKIN:
 
 VISUAL STYLE - LEGENDARY TIER:
 - GOLD and CHROME metallic armor pieces
@@ -66,8 +39,14 @@ COLOR PALETTE: Gold, silver, chrome, with glowing blue/purple/orange accents
 
 REFERENCE SKINS: Omega, Ragnarok, Ice King, Midas
 This should look like a 2000 V-Bucks skin!""",
-
-        "anime": """**ANIME SERIES SKIN**
+    ),
+    SkinStyle(
+        id="anime",
+        name="Anime",
+        description="Cel-shaded anime/manga character style",
+        color="#ff6b9d",
+        icon="🌸",
+        prompt="""**ANIME SERIES SKIN**
 
 Create an ANIME-STYLED character:
 - Cel-shaded manga aesthetic
@@ -80,8 +59,14 @@ Create an ANIME-STYLED character:
 
 Think: Naruto series, Dragon Ball, My Hero Academia tier.
 A skin straight from your favorite anime!""",
-
-        "meme": """CREATE A MEME LORD FORTNITE SKIN:
+    ),
+    SkinStyle(
+        id="meme",
+        name="Meme Lord",
+        description="Funny, goofy, viral-worthy character",
+        color="#f39c12",
+        icon="😂",
+        prompt="""CREATE A MEME LORD FORTNITE SKIN:
 
 VISUAL STYLE - FUNNY/GOOFY:
 - RIDICULOUS and HILARIOUS character design
@@ -96,8 +81,14 @@ COLOR PALETTE: Bright, silly colors - yellows, pinks, whatever's funny
 
 REFERENCE SKINS: Peely (banana), Fishstick, Guff, Lil Whip
 Make people LAUGH when they see this skin!""",
-
-        "cyberpunk": """CREATE A CYBERPUNK FORTNITE SKIN:
+    ),
+    SkinStyle(
+        id="cyberpunk",
+        name="Cyberpunk",
+        description="Neon-lit futuristic cyber warrior",
+        color="#00ffff",
+        icon="🤖",
+        prompt="""CREATE A CYBERPUNK FORTNITE SKIN:
 
 VISUAL STYLE - NEON CYBER FUTURE:
 - GLOWING NEON lights (hot pink, cyan, electric blue)
@@ -113,8 +104,14 @@ COLOR PALETTE: Black base + HOT PINK + CYAN + ELECTRIC BLUE neon
 
 REFERENCE: Cyberpunk 2077, Tron, neon dystopia
 Make it GLOW with neon energy!""",
-
-        "horror": """CREATE A HORROR FORTNITE SKIN:
+    ),
+    SkinStyle(
+        id="horror",
+        name="Horror",
+        description="Creepy, spooky Fortnitemares style",
+        color="#8b0000",
+        icon="👻",
+        prompt="""CREATE A HORROR FORTNITE SKIN:
 
 VISUAL STYLE - CREEPY/SCARY:
 - TERRIFYING and UNSETTLING design
@@ -129,20 +126,55 @@ VISUAL STYLE - CREEPY/SCARY:
 COLOR PALETTE: Dark blacks, grays, with red/green accents
 
 REFERENCE SKINS: Skull Trooper, Chaos Agent, Cube Queen
-Perfect for Fortnitemares - genuinely CREEPY!"""
-    }
+Perfect for Fortnitemares - genuinely CREEPY!""",
+    ),
+)
 
-    # Get style-specific prompt (default to legendary)
-    style_key = style.lower()
-    if style_key not in style_prompts:
-        style_key = "legendary"
-    
-    style_prompt = style_prompts[style_key]
-    
-    # Build the full prompt with clear structure
-    full_prompt = f"""You are creating a Fortnite character skin. Generate a FULL BODY character image.
+_STYLE_PROMPTS = {style.id: style.prompt for style in STYLES}
+_DEFAULT_STYLE_PROMPT = _STYLE_PROMPTS["legendary"]
+
+
+# Read-only catalog entries, built once and shared by every caller
+_STYLE_CATALOG = tuple(
+    MappingProxyType({
+        "id": style.id,
+        "name": style.name,
+        "description": style.description,
+        "color": style.color,
+        "icon": style.icon
+    })
+    for style in STYLES
+)
+
+
+STYLES_BY_ID = MappingProxyType({entry["id"]: entry for entry in _STYLE_CATALOG})
+
+
+def get_skin_styles() -> tuple:
+    """Returns all available Fortnite skin styles - 5 distinct options (read-only)"""
+    return _STYLE_CATALOG
+
+
+def get_style(style_id: str) -> Optional[Mapping]:
+    """Returns the catalog entry for a style id, or None if it is unknown"""
+    return STYLES_BY_ID.get(style_id)
+
+
+# The catalog never changes at runtime, so encode the /styles body once
+# (orjson does not serialize mappingproxy, hence the dict copies)
+_STYLES_JSON = orjson.dumps({"styles": [dict(style) for style in _STYLE_CATALOG]})
+
+
+def get_skin_styles_json() -> bytes:
+    """Returns the /styles response body, pre-serialized"""
+    return _STYLES_JSON
 
-{style_prompt}
+
+_PROMPT_HEADER = """You are creating a Fortnite character skin. Generate a FULL BODY character image.
+
+"""
+
+_PROMPT_REQUIREMENTS = """
 
 CRITICAL REQUIREMENTS:
 1. FULL BODY - Show complete character from HEAD TO TOE (not cropped)
@@ -158,14 +190,7 @@ Transform the input image into this style while keeping recognizable features fr
 IMPORTANT: Every generated skin MUST have the gradient background AND the circular standing platform!
 """
 
-    # Add custom prompt if provided
-    if custom_prompt:
-        full_prompt += f"""
-ADDITIONAL INSTRUCTIONS FROM USER:
-{custom_prompt}
-"""
-
-    full_prompt += """
+_PROMPT_FOOTER = """
 OUTPUT: Generate the Fortnite skin image with:
 - GRADIENT BACKGROUND (dark blue to purple)
 - CIRCULAR GLOWING PLATFORM at the character's feet
@@ -178,4 +203,36 @@ Also include:
 - Short Item Shop description
 """
 
-    return full_prompt
+
+def _build_prompt(style_prompt: str, custom_prompt: str) -> str:
+    """Wrap a style prompt in the shared instructions"""
+    if not custom_prompt:
+        return "".join((_PROMPT_HEADER, style_prompt, _PROMPT_REQUIREMENTS, _PROMPT_FOOTER))
+
+    # Only the user's instructions need formatting
+    custom_block = f"""
+ADDITIONAL INSTRUCTIONS FROM USER:
+{custom_prompt}
+"""
+    return "".join((_PROMPT_HEADER, style_prompt, _PROMPT_REQUIREMENTS, custom_block, _PROMPT_FOOTER))
+
+
+# Prompts without custom instructions are the same for every request, so
+# build them once per style at import time
+_PROMPT_CACHE = {
+    style_key: _build_prompt(style_prompt, "")
+    for style_key, style_prompt in _STYLE_PROMPTS.items()
+}
+_DEFAULT_PROMPT = _PROMPT_CACHE["legendary"]
+
+
+def get_fortnite_skin_prompt(style: str = "legendary", custom_prompt: str = "") -> str:
+    """
+    Returns the prompt for generating a Fortnite skin based on style.
+    Each style has a VERY DISTINCT visual direction.
+    """
+    # Get style-specific prompt (default to legendary)
+    style_key = style.lower()
+    if not custom_prompt:
+        return _PROMPT_CACHE.get(style_key, _DEFAULT_PROMPT)
+    return _build_prompt(_STYLE_PROMPTS.get(style_key, _DEFAULT_STYLE_PROMPT), custom_prompt)